@@ -1,8 +1,11 @@
-from .physics import *
-from tools import *
-from geo2xml import generate_mesh
 from dirnames import *
+from .lazy import lazy_package as _lazy_package
 
-from geometries import get_geo, get_pore
-from scripts import * #simulation2D, simulate
-
+# everything below is imported on first access, see nanopores.lazy
+_lazy_package(__name__, [
+    ".physics",
+    ".tools",
+    (".geo2xml", ["generate_mesh"]),
+    (".geometries", ["get_geo", "get_pore"]),
+    ".scripts", #simulation2D, simulate
+])
@@ -1,7 +1,14 @@
 """ some parametrized dolfin SubDomains for snapping mesh to curved boundaries """
 
 from dolfin import *
-#import numpy
+import numpy as np
+
+# the snap() methods below work on single points as well as on arrays of
+# points (one per row), which lets Geometry.snap_to_boundary move all
+# boundary vertices at once.
+def vectorized(snap):
+    snap.vectorized = True
+    return snap
 
 class Cylinder(SubDomain):
     # cylinder aligned with z axis
@@ -13,7 +20,7 @@ class Cylinder(SubDomain):
         self.R, self.L, self.c, self.frac = R, L, center, frac
         
     def r(self, x):
-        return sqrt((x[0] - self.c[0])**2 + (x[1] - self.c[1])**2)
+        return np.sqrt((x[..., 0] - self.c[0])**2 + (x[..., 1] - self.c[1])**2)
         
     def z(self, x):
         return abs(x[2] - self.c[2])
@@ -22,13 +29,12 @@ class Cylinder(SubDomain):
         return between(self.r(x), (self.frac*self.R, 1./self.frac*self.R)) and (
                between(self.z(x), (0., 0.5*self.L)) )
 
+    @vectorized
     def snap(self, x):
         r = self.r(x)
-        #if self.inside(x, False):
-        x[0] = self.c[0] + (self.R / r)*(x[0] - self.c[0])
-        x[1] = self.c[1] + (self.R / r)*(x[1] - self.c[1])
+        x[..., 0] = self.c[0] + (self.R / r)*(x[..., 0] - self.c[0])
+        x[..., 1] = self.c[1] + (self.R / r)*(x[..., 1] - self.c[1])
             
-#import numpy as np
 class Circle(SubDomain):
     # hole
 
@@ -38,7 +44,7 @@ class Circle(SubDomain):
         print "DEBUG", self.c, self.R
         
     def r(self, x):
-        return sqrt((x[0] - self.c[0])**2 + (x[1] - self.c[-1])**2)
+        return np.sqrt((x[..., 0] - self.c[0])**2 + (x[..., 1] - self.c[-1])**2)
 
     def inside(self, x, _):
         return between(self.r(x), (0.*self.frac*self.R, 1./self.frac*self.R))
@@ -46,16 +52,14 @@ class Circle(SubDomain):
     def on_boundary(self, x):
         return self.R - 1e-1 <= self.r(x) <= self.R + 1e-1
 
+    @vectorized
     def snap(self, x):
         r = self.r(x)
-        #xold = np.copy(x)
-        if self.inside(x, False):
-            x[0] = self.c[0] + (self.R / r)*(x[0] - self.c[0])
-            x[1] = self.c[-1] + (self.R / r)*(x[1] - self.c[-1])
-#        
-#        rr = np.sqrt(np.sum((xold - x)**2))
-#        if rr > 1e-3:
-#            print "snap %.4f" % rr, r, xold, "-->", x
+        # same as self.inside, for all points at once
+        near = r <= 1./self.frac*self.R + DOLFIN_EPS
+        scale = np.where(near, self.R / r, 1.)
+        x[..., 0] = self.c[0] + scale*(x[..., 0] - self.c[0])
+        x[..., 1] = self.c[-1] + scale*(x[..., 1] - self.c[-1])
             
             
 class Sphere(SubDomain):
@@ -66,16 +70,17 @@ class Sphere(SubDomain):
         self.R, self.c, self.frac = R, center, frac
         
     def r(self, x):
-        return sqrt(sum((xi - ci)**2 for xi, ci in zip(x, self.c)))
+        return np.sqrt(sum((x[..., i] - ci)**2 for i, ci in enumerate(self.c)))
 
     def inside(self, x, _):
         return between(self.r(x), (self.frac*self.R, 1./self.frac*self.R))
         
+    @vectorized
     def snap(self, x):
         r = self.r(x)
-        x[0] = self.c[0] + (self.R / r)*(x[0] - self.c[0])
-        x[1] = self.c[1] + (self.R / r)*(x[1] - self.c[1])
-        x[2] = self.c[2] + (self.R / r)*(x[2] - self.c[2])
+        x[..., 0] = self.c[0] + (self.R / r)*(x[..., 0] - self.c[0])
+        x[..., 1] = self.c[1] + (self.R / r)*(x[..., 1] - self.c[1])
+        x[..., 2] = self.c[2] + (self.R / r)*(x[..., 2] - self.c[2])
 
 
 # associate the actual boundary with every SubDomain that has .on_boundary()            
@@ -89,29 +94,4 @@ class Boundary(SubDomain):
 # snap vertices on a (interior or exterior) boundary to SubDomain
 # TODO: this actually needs just the snap function
 def snap_to_boundary(geo, name, subdomain):
-    mesh = geo.mesh
-    # get vertices that lie on this boundary
-    # -- mark a CG1 Function with ones on the boundary
-    V = FunctionSpace(mesh, 'CG', 1)
-    bc = geo.BC(V, 1., name)
-    u = Function(V)
-    bc.apply(u.vector())
-
-    # Get vertices sitting on boundary
-    d2v = dof_to_vertex_map(V)
-    vertices_on_boundary = d2v[u.vector() == 1.0]
-
-    # Mark VertexFunction to check
-    #
-    for v in vertices_on_boundary:
-        x = mesh.coordinates()[v]
-        subdomain.snap(x)
-        mesh.geometry().set(v, x)
-
-    mesh.smooth(1)
-    #vf = VertexFunction('size_t', mesh, 0)
-    #vf.array()[vertices_on_boundary] = 1.
-    #plot(vf)
-    #interactive()
-            
-
+    geo.snap_to_boundary(name, subdomain.snap, smooth=True)
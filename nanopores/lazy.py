@@ -0,0 +1,77 @@
+"""lazy package namespaces.
+
+importing the package itself is cheap: submodules are imported when they are
+first accessed, and the star-imports that populate the package namespace
+(and pull in dolfin and matplotlib) only run when some other name is looked
+up for the first time. this way, pure-numpy modules like tools.fields can be
+used without dolfin."""
+import sys, imp
+from importlib import import_module
+from types import ModuleType
+
+__all__ = ["LazyModule", "lazy_package"]
+
+class LazyModule(ModuleType):
+
+    def __init__(self, module, star=()):
+        ModuleType.__init__(self, module.__name__, module.__doc__)
+        self.__dict__.update(vars(module))
+        # keep a reference, python 2 clears the globals of deleted modules
+        self._module = module
+        self._star = list(star)
+        self._loaded = False
+
+    def _is_submodule(self, name):
+        try:
+            f, _, _ = imp.find_module(name, self.__path__)
+        except ImportError:
+            return False
+        if f is not None:
+            f.close()
+        return True
+
+    def _load(self):
+        # flag is set first, so that circular imports during loading see the
+        # partially filled namespace, like with an ordinary module
+        if self._loaded:
+            return
+        self._loaded = True
+        for item in self._star:
+            if isinstance(item, tuple):
+                name, public = item
+            else:
+                name, public = item, None
+            mod = import_module(name, self.__name__)
+            if public is None:
+                public = getattr(mod, "__all__", None)
+            if public is None:
+                public = [k for k in vars(mod) if not k.startswith("_")]
+            for k in public:
+                setattr(self, k, getattr(mod, k))
+
+    def __getattr__(self, name):
+        # only called if normal attribute lookup fails
+        if name == "__all__":
+            # from package import * -- fill namespace, then let python
+            # fall back to __dict__
+            self._load()
+            raise AttributeError(name)
+        if name.startswith("__"):
+            raise AttributeError(name)
+        if not self._loaded and self._is_submodule(name):
+            return import_module("." + name, self.__name__)
+        self._load()
+        if name in self.__dict__:
+            return self.__dict__[name]
+        if self._is_submodule(name):
+            return import_module("." + name, self.__name__)
+        raise AttributeError("'module' object has no attribute '%s'" %name)
+
+def lazy_package(name, star):
+    """replace package in sys.modules by lazy version, call at end of __init__.
+    star is a list of (relative) module names whose public names are imported
+    on demand, or (module, names) tuples to import only the given names."""
+    module = sys.modules[name]
+    lazy = LazyModule(module, star)
+    sys.modules[name] = lazy
+    return lazy
@@ -17,6 +17,7 @@ def friction(setup, visualize=False):
 
     if geo.mesh.num_cells() < setup.solverp.Nmax:
         setup.prerefine(True)
+        geo, phys = setup.geo, setup.phys
 
     if dim==3 and geo.mesh.num_cells()>2e5:
         pnps.SimpleStokesProblem.method["kparams"]["maximum_iterations"] = 5000
@@ -74,6 +75,7 @@ def friction_tensor(setup):
 
     if geo.mesh.num_cells() < setup.solverp.Nmax:
         setup.prerefine(True)
+        geo, phys = setup.geo, setup.phys
 
     if dim==3 and geo.mesh.num_cells()>2e5:
         pnps.SimpleStokesProblem.method["kparams"]["maximum_iterations"] = 5000
@@ -7,18 +7,39 @@ from scipy.interpolate import interp1d
 import dolfin
 
 import nanopores
-from nanopores.tools.interpolation import harmonic_interpolation
+from nanopores.tools.interpolation import harmonic_interpolation_vector
 from nanopores.models.eikonal import distance_boundary_from_geo
 from nanopores.tools import fields
 
-def transformation(n, Dn, Dt):
-    # TODO RR =
-    D = np.diag([Dn, Dt, Dt]) if len(n)==3 else np.diag([Dn, Dt])
-    U, S, V = np.linalg.svd(np.matrix(n))
-    # U, S = 1., |n|
-    # V = orthogonal coordinate basis with n/|n| as first vector
-    D = np.dot(V, np.dot(D, V.T))
-    return np.diag(np.diag(D))
+def transformation_diag(n, Dn, Dt):
+    """diagonal of the diffusivity tensor Dn*nn^T + Dt*(I - nn^T), with
+    unit normal nn, for many normals n (one per row) at once.
+    the tangential part is Dt on the whole tangent plane, independent of
+    any choice of tangent basis."""
+    n = np.asarray(n, dtype=float)
+    n2 = np.sum(n**2, 1)
+    nn = np.zeros_like(n)
+    nn[:, 0] = 1. # use first axis as normal if n = 0
+    nonzero = n2 > 0.
+    nn[nonzero] = n[nonzero]**2 / n2[nonzero, None]
+    Dn = np.asarray(Dn, dtype=float)[:, None]
+    Dt = np.asarray(Dt, dtype=float)[:, None]
+    return Dt + (Dn - Dt)*nn
+
+def dof_data(geo, dist, normal):
+    "coordinates, distance and normal at all CG1 dofs"
+    V = dolfin.FunctionSpace(geo.mesh, "CG", 1)
+    x = geo.mesh.coordinates()[dolfin.dof_to_vertex_map(V)]
+    d = dolfin.interpolate(dist, V).vector().array()
+    n = np.column_stack([dolfin.interpolate(ni, V).vector().array()
+                         for ni in normal.split(deepcopy=True)])
+    return V, x, d, n
+
+def dof_function(V, values):
+    f = dolfin.Function(V)
+    f.vector().set_local(np.array(values, dtype=float))
+    f.vector().apply("insert")
+    return f
 
 def preprocess_Dr(data, r, normalize=True):
     x = data["x"] #[xx[0] for xx in data["x"]]
@@ -46,13 +67,14 @@ def Dt_plane(h, r):
 sinh = np.sinh
 acosh = np.arccosh
 def Dn_plane(l, r, N=100):
-    alpha = acosh(l/r)
-    s = 0.
-    for n in range(1, N):
-        n = float(n)
-        K = n*(n+1)/(2*n-1)/(2*n+3)
-        s += K*((2*sinh((2*n+1)*alpha)+(2*n+1)*sinh(2*alpha))/(4*(sinh((n+.5)*alpha))**2-(2*n+1)**2*(sinh(alpha))**2) - 1)
-    return 1./((4./3.)*sinh(alpha)*s)
+    # works for scalar and array l, series terms are summed along last axis
+    alpha = acosh(np.asarray(l, dtype=float)/r)
+    a = alpha[..., None]
+    n = np.arange(1., N)
+    K = n*(n+1)/(2*n-1)/(2*n+3)
+    s = np.sum(K*((2*sinh((2*n+1)*a)+(2*n+1)*sinh(2*a))/(4*(sinh((n+.5)*a))**2-(2*n+1)**2*(sinh(a))**2) - 1), -1)
+    D = 1./((4./3.)*sinh(alpha)*s)
+    return float(D) if np.isscalar(l) else D
 
 def matrix(d):
     return [[d[0], 0., 0.], [0., d[1], 0.], [0., 0., d[2]]]
@@ -61,7 +83,7 @@ def diff_profile_plane(r):
     eps = 1e-8
     x = np.linspace(r+eps, r*16., 100)
 
-    Dn = np.array([Dn_plane(xx, r) for xx in x])
+    Dn = Dn_plane(x, r)
     Dt = Dt_plane(x, r)
 
     data = dict(x=list(x), D=map(matrix, zip(Dn, Dt, Dt)))
@@ -103,32 +125,21 @@ def diffusivity_field(setup, r, ddata_r=None, ddata_z=None,
     phys = setup.phys
     D0 = phys.kT / (6.*np.pi*phys.eta*r*1e-9)
 
-    def DPore(x, i):
-        r = dist(x)
-        z = x[-1]
-        Dz = float(fz(z))
-        n = normal(x)
-        Dn = D0*float(fn(r))
-        Dt = D0*float(ft(r))
-        D = transformation(n, Dz*Dn, Dz*Dt)
-        return D[i][i]
-
-    def DBulk(x, i):
-        r = dist(x)
-        n = normal(x)
-        Dn = D0*float(fn(r))
-        Dt = D0*float(ft(r))
-        D = transformation(n, Dn, Dt)
-        return D[i][i]
-
-    D = lambda i: {
-        "bulkfluid": lambda x: DBulk(x, i),
-        poreregion: lambda x: DPore(x, i)}
+    # evaluate profiles at all dofs at once; values outside the
+    # respective subdomain are not used, so z can be clipped to data range
+    V, x, d, n = dof_data(setup.geo, dist, normal)
+    Dz = fz(np.clip(x[:, -1], min(z), max(z)))
+    Dn = D0*fn(d)
+    Dt = D0*ft(d)
+    DPore = transformation_diag(n, Dz*Dn, Dz*Dt)
+    DBulk = transformation_diag(n, Dn, Dt)
 
     dim = setup.geop.dim
-    DD = [harmonic_interpolation(setup, subdomains=D(i)) for i in range(dim)]
-    D = dolfin.Function(VV)
-    dolfin.assign(D, DD)
+    DBulk = [dof_function(V, DBulk[:, i]) for i in range(dim)]
+    DPore = [dof_function(V, DPore[:, i]) for i in range(dim)]
+    D = harmonic_interpolation_vector(setup, subdomains={
+        "bulkfluid": DBulk,
+        poreregion: DPore})
 
     return dict(dist=dist, D=D)
 
@@ -147,34 +158,20 @@ def diffusivity_field_alt(setup, r, ddata_pore, ddata_bulk):
     phys = setup.phys
     D0 = phys.kT / (6.*np.pi*phys.eta*r*1e-9)
 
-    def DPore(x, i):
-        r = dist(x)
-        n = normal(x)
-        Dn = D0*float(fn_pore(r))
-        Dt = D0*float(ft_pore(r))
-        D = transformation(n, Dn, Dt)
-        return D[i][i]
-
-    def DBulk(x, i):
-        r = dist(x)
-        n = normal(x)
-        Dn = D0*float(fn(r))
-        Dt = D0*float(ft(r))
-        D = transformation(n, Dn, Dt)
-        return D[i][i]
-
-    D = lambda i: dict(
-        bulkfluid = lambda x: DBulk(x, i),
-        nearpore = lambda x: DBulk(x, i),
-        poreenter = lambda x: DBulk(x, i),
-        porecurrent = lambda x: DPore(x, i),
-        porerest = lambda x: DPore(x, i),
-    )
+    V, x, d, n = dof_data(setup.geo, dist, normal)
+    DPore = transformation_diag(n, D0*fn_pore(d), D0*ft_pore(d))
+    DBulk = transformation_diag(n, D0*fn(d), D0*ft(d))
 
     dim = setup.geop.dim
-    DD = [harmonic_interpolation(setup, subdomains=D(i)) for i in range(dim)]
-    D = dolfin.Function(VV)
-    dolfin.assign(D, DD)
+    DBulk = [dof_function(V, DBulk[:, i]) for i in range(dim)]
+    DPore = [dof_function(V, DPore[:, i]) for i in range(dim)]
+    D = harmonic_interpolation_vector(setup, subdomains=dict(
+        bulkfluid = DBulk,
+        nearpore = DBulk,
+        poreenter = DBulk,
+        porecurrent = DPore,
+        porerest = DPore,
+    ))
 
     return dict(dist=dist, D=D)
 
@@ -192,22 +189,14 @@ def diffusivity_field_simple(setup, r, ddata_bulk, boundary="poresolidb"):
     phys = setup.phys
     D0 = phys.kT / (6.*np.pi*phys.eta*r*1e-9)
 
-    def DBulk(x, i):
-        r = dist(x)
-        n = normal(x)
-        Dn = D0*float(fn(r))
-        Dt = D0*float(ft(r))
-        D = transformation(n, Dn, Dt)
-        return D[i][i]
-
-    D = lambda i: dict(
-        fluid = lambda x: DBulk(x, i),
-    )
+    V, x, d, n = dof_data(setup.geo, dist, normal)
+    DBulk = transformation_diag(n, D0*fn(d), D0*ft(d))
 
     dim = setup.geop.dim
-    DD = [harmonic_interpolation(setup, subdomains=D(i)) for i in range(dim)]
-    D = dolfin.Function(VV)
-    dolfin.assign(D, DD)
+    DBulk = [dof_function(V, DBulk[:, i]) for i in range(dim)]
+    D = harmonic_interpolation_vector(setup, subdomains=dict(
+        fluid = DBulk,
+    ))
 
     return dict(dist=dist, D=D)
 
@@ -1,5 +1,9 @@
 "solve eikonal equation to get distance to boundary"
 from dolfin import *
+import heapq
+import itertools
+import math
+import numpy as np
 
 def distance_boundary_from_geo_OLD(geo, boundary="dnab"):
     mesh = geo.mesh
@@ -77,6 +81,125 @@ def distance_boundary_from_geo(geo, boundary="dnab",
 
     return u
 
+def distance_boundary_fmm(geo, boundary="dnab"):
+    """drop-in alternative to distance_boundary_from_geo: solves the eikonal
+    equation with a fast marching method on the mesh vertices.
+    returns CG1 Function."""
+    mesh = geo.mesh
+    V = FunctionSpace(mesh, "CG", 1)
+
+    # get vertices on boundary (via BC for CG1 function)
+    u = Function(V)
+    for name in [boundary, "memb"]:
+        geo.BC(V, Constant(1.), name).apply(u.vector())
+    d2v = dof_to_vertex_map(V)
+    sources = d2v[u.vector().array() == 1.]
+
+    d = fast_marching(mesh.coordinates(), mesh.cells(), sources)
+    u.vector()[:] = d[d2v]
+    return u
+
+def fast_marching(coordinates, cells, sources):
+    "distance to source vertices on simplicial mesh, O(N log N)"
+    co = np.asarray(coordinates, dtype=float)
+    cells = np.asarray(cells)
+    n = co.shape[0]
+
+    # vertex -> cells connectivity as flat arrays
+    flat = cells.ravel()
+    order = np.argsort(flat, kind="mergesort")
+    owners = order // cells.shape[1]
+    offsets = np.searchsorted(flat[order], np.arange(n + 1))
+
+    # plain python containers are much faster for the scalar work below
+    x = [tuple(p) for p in co]
+    cells = cells.tolist()
+    u = [np.inf]*n
+    accepted = [False]*n
+    for v in sources:
+        u[v] = 0.
+    heap = [(0., v) for v in set(sources)]
+    heapq.heapify(heap)
+
+    while heap:
+        _, v = heapq.heappop(heap)
+        if accepted[v]:
+            continue
+        accepted[v] = True
+        for c in owners[offsets[v]:offsets[v+1]]:
+            cell = cells[c]
+            known = [k for k in cell if accepted[k] and k != v]
+            for w in cell:
+                if accepted[w]:
+                    continue
+                uw = _local_update(x, u, v, known, w)
+                if uw < u[w]:
+                    u[w] = uw
+                    heapq.heappush(heap, (uw, w))
+    return np.array(u)
+
+def _local_update(x, u, v, known, w):
+    # minimal value at w from all faces of the cell that contain v
+    y = x[w]
+    best = u[v] + _norm(_sub(y, x[v]))
+    for k in known:
+        best = min(best, _update1(x[v], x[k], u[v], u[k], y))
+    for k, l in itertools.combinations(known, 2):
+        best = min(best, _update2(x[v], x[k], x[l], u[v], u[k], u[l], y))
+    return best
+
+def _sub(a, b):
+    return [ai - bi for ai, bi in zip(a, b)]
+
+def _dot(a, b):
+    return sum(ai*bi for ai, bi in zip(a, b))
+
+def _norm(a):
+    return math.sqrt(_dot(a, a))
+
+# minimum over points p in the simplex (x0, x1[, x2]) of u(p) + |y - p|,
+# with u linear in the simplex. if the minimum is attained on the boundary
+# of the simplex, a lower-dimensional face gives the same value, so inf is
+# returned in that case.
+def _update1(x0, x1, u0, u1, y):
+    e = _sub(x1, x0)
+    yy = _sub(y, x0)
+    g = _dot(e, e)
+    delta = u1 - u0
+    q = delta*delta/g
+    if q >= 1.:
+        return np.inf
+    a = _dot(e, yy)/g
+    perp = _sub(yy, [a*ei for ei in e])
+    r = _norm(perp)/math.sqrt(1. - q)
+    mu = a - r*delta/g
+    if mu < 0. or mu > 1.:
+        return np.inf
+    return u0 + delta*mu + r
+
+def _update2(x0, x1, x2, u0, u1, u2, y):
+    e1 = _sub(x1, x0)
+    e2 = _sub(x2, x0)
+    yy = _sub(y, x0)
+    g11, g12, g22 = _dot(e1, e1), _dot(e1, e2), _dot(e2, e2)
+    det = g11*g22 - g12*g12
+    if det <= 0.:
+        return np.inf
+    # inverse of the Gram matrix
+    i11, i12, i22 = g22/det, -g12/det, g11/det
+    d1, d2 = u1 - u0, u2 - u0
+    Gd1, Gd2 = i11*d1 + i12*d2, i12*d1 + i22*d2
+    q = d1*Gd1 + d2*Gd2
+    if q >= 1.:
+        return np.inf
+    b1, b2 = _dot(e1, yy), _dot(e2, yy)
+    a1, a2 = i11*b1 + i12*b2, i12*b1 + i22*b2
+    perp = [yi - a1*ei - a2*fi for yi, ei, fi in zip(yy, e1, e2)]
+    r = _norm(perp)/math.sqrt(1. - q)
+    mu1, mu2 = a1 - r*Gd1, a2 - r*Gd2
+    if mu1 < 0. or mu2 < 0. or mu1 + mu2 > 1.:
+        return np.inf
+    return u0 + d1*mu1 + d2*mu2 + r
 
 if __name__ == "__main__":
     import nanopores.geometries.pughpore as pughpore
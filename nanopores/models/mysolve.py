@@ -1,5 +1,6 @@
 """ define solvers that record cumulative times needed for every loop """
 
+import numpy as np
 from dolfin import *
 from nanopores.tools.pdesystem import newtonsolve
 from nanopores import *
@@ -254,25 +255,59 @@ def geo_debug(geo):
         #plot(submesh, title=("initial mesh on %s" %subd), wireframe=True, elevate=-3e1)
     interactive()
 
-def mesh_quality(mesh, oldmesh=None, ratio=1e-1, geo=None, plothist=True, plot_cells=False):
-    #vertex = VertexFunction("bool", mesh, False)
-    dgncells = CellFunction("size_t", mesh, 0)
+def radius_ratios(mesh):
+    """array of cell radius ratios dim*inradius/circumradius, as computed by
+    Cell.radius_ratio (1 for equilateral, 0 for degenerate cells)"""
+    x = mesh.coordinates()[mesh.cells()]
+    tdim = x.shape[1] - 1
+    if tdim == 1:
+        return np.ones(len(x))
+    # edge lengths, opposite edges are (01, 23), (02, 13), (03, 12)
+    def length(i, j):
+        return np.sqrt(((x[:, i] - x[:, j])**2).sum(axis=1))
+    def area(a, b, c):
+        # heron, in stable form; a >= b >= c
+        a, b, c = np.sort([a, b, c], axis=0)[::-1]
+        s = (a+(b+c))*(c-(a-b))*(c+(a-b))*(a+(b-c))
+        return .25*np.sqrt(np.maximum(s, 0.))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if tdim == 2:
+            a, b, c = length(1, 2), length(0, 2), length(0, 1)
+            A = area(a, b, c)
+            rr = 16.*A**2/((a + b + c)*a*b*c)
+        else:
+            a, b, c = length(0, 1), length(0, 2), length(0, 3)
+            A, B, C = length(2, 3), length(1, 3), length(1, 2)
+            V = np.abs(np.einsum("ij,ij->i", x[:, 1] - x[:, 0],
+                np.cross(x[:, 2] - x[:, 0], x[:, 3] - x[:, 0])))/6.
+            faces = area(a, b, C) + area(a, c, B) + area(b, c, A) + area(A, B, C)
+            la, lb, lc = a*A, b*B, c*C
+            s = (la+lb+lc)*(la+lb-lc)*(la-lb+lc)*(-la+lb+lc)
+            R = np.sqrt(np.maximum(s, 0.))/(24.*V)
+            rr = 9.*V/(faces*R)
+    rr[~np.isfinite(rr)] = 0.
+    return rr
 
-    ndeg = 0
-    for c in cells(mesh):
-        if c.radius_ratio() < ratio:
-            dgncells[c] = 1
-            ndeg += 1
+def mesh_quality(mesh, oldmesh=None, ratio=1e-1, geo=None, plothist=True, plot_cells=False):
+    "print radius ratio statistics, return boolean array of degenerate cells"
+    rr = radius_ratios(mesh)
+    degenerate = rr < ratio
+    ndeg = degenerate.sum()
 
     print "%s degenerate cells of radius ratio < %s." % (ndeg, ratio)
-    minrr = MeshQuality.radius_ratio_min_max(mesh)[0]
+    minrr = rr.min()
     print "Minimal radius ratio of mesh:", minrr
     if plothist:
         from matplotlib import pyplot
         pyplot.figure()
-        exec(MeshQuality.radius_ratio_matplotlib_histogram(mesh, 200), locals())
+        pyplot.hist(rr, bins=200, range=(0., 1.))
+        pyplot.xlabel("radius ratio")
+        pyplot.ylabel("number of cells")
     # plot degenerate cells
     if minrr < ratio and plot_cells:
+        dgncells = CellFunction("size_t", mesh, 0)
+        dgncells.array()[:] = degenerate
         submesh = SubMesh(mesh, dgncells, 1)
         title = "degenerate N=%s" %mesh.num_cells()
         #plot(submesh, title=title)
@@ -285,6 +320,7 @@ def mesh_quality(mesh, oldmesh=None, ratio=1e-1, geo=None, plothist=True, plot_c
             oldcells = CellFunction("size_t", oldmesh, 0)
             oldcells.array()[:] = dgncells.array()
             plot(SubMesh(oldmesh, oldcells, 1), "old degenerate cells N=%s" %mesh.num_cells())
+    return degenerate
 
 def save_Fref(pb, pnps):
     z = pnps.phys.dim - 1
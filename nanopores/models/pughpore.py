@@ -132,6 +132,7 @@ def solve(setup, visualize=False):
 
     if geo.mesh.num_cells() < solverp.Nmax:
         pb = prerefine(setup, visualize)
+        geo, phys = setup.geo, setup.phys
     else:
         pb = None
 
@@ -166,6 +167,9 @@ def get_forces(setup, pnps):
     return forces
 
 def prerefine(setup, visualize=False):
+    # a cached mesh replaces setup.geo and setup.phys
+    if setup.prerefined or setup.load_prerefined():
+        return None
     geo, phys, p = setup.geo, setup.phys, setup.solverp
     dolfin.tic()
     if setup.geop.x0 is None:
@@ -185,6 +189,7 @@ def prerefine(setup, visualize=False):
                 dolfin.plot(geo.boundaries, key="b", title="adapted mesh",
                             scalarbar=False)
     print "CPU time (PB): %.3g s" %(dolfin.toc(),)
+    setup.save_prerefined()
     return pb
 
 def set_D(setup):
@@ -233,13 +238,24 @@ class u1D(dolfin.Expression):
         self.u = u
         self.damping = damping
         #dolfin.Expression.__init__(self)
+        # P1 functions are evaluated by linear interpolation of vertex
+        # values, which is much cheaper than u(x) for every boundary dof
+        self.z = None
+        if u.function_space().ufl_element().degree() == 1:
+            z = u.function_space().mesh().coordinates()[:, 0]
+            I = np.argsort(z)
+            self.z = z[I]
+            self.values = u.compute_vertex_values()[I]
 
     def damp(self, scalar):
         self.damping *= scalar
 
     def eval(self, value, x):
         dim = x.shape[0]
-        value[0] = self.damping*self.u(x[dim-1])
+        if self.z is not None:
+            value[0] = self.damping*np.interp(x[dim-1], self.z, self.values)
+        else:
+            value[0] = self.damping*self.u(x[dim-1])
 
 def set_sideBCs(phys, geop, physp):
     geo, pnp = solve1D(geop, physp)
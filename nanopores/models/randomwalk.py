@@ -5,7 +5,6 @@ import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 from matplotlib import animation
 from matplotlib import collections
-from scipy.stats import poisson, gamma
 
 import dolfin
 import nanopores
@@ -14,6 +13,9 @@ from nanopores.tools.polygons import Polygon, Ball, isempty
 from nanopores.models import nanopore
 from nanopores.tools.poreplots import streamlines
 from nanopores.tools import fields
+from nanopores.models.randomwalk_helpers import (_load, load_results,
+    integrate_hist, integrate_values, exponential_hist, histogram,
+    hist_poisson, solve_newton, poisson_from_positiveK)
 
 dolfin.parameters["allow_extrapolation"] = False #True
 
@@ -683,15 +685,6 @@ def setup_default(params):
     pore = get_pore(**params)
     return RandomWalk(pore, **params)
         
-def _load(a):
-    return a.load() if isinstance(a, fields.NpyFile) else a
-    
-def load_results(name, **params):
-    data = fields.get_fields(name, **params) 
-    data = nanopores.Params({k: _load(data[k]) for k in data})
-    print "Found %d simulated events." % len(data.times)
-    return data
-
 def get_results(name, params, setup=setup_default, calc=True):
     # setup is function rw = setup(params) that sets up rw
     # check existing saved rws
@@ -776,119 +769,6 @@ def video(rw, cyl=False, **aniparams):
                                   init_func=init, **aniparams)
     return ani
 
-def integrate_hist(hist, cutoff):
-    n, bins, _ = hist
-    I, = np.nonzero(bins > cutoff)
-    return np.dot(n[I[:-1]], np.diff(bins[I]))
-
-def integrate_values(T, fT, cutoff):
-    values = 0.5*(fT[:-1] + fT[1:])
-    I, = np.nonzero(T > cutoff)
-    return np.dot(values[I[:-1]], np.diff(T[I]))
-
-def exponential_hist(times, a, b, **params):
-    cutoff = 0.03 # cutoff frequency in ms
-    if len(times) == 0:
-        return
-    bins = np.logspace(a, b, 100)
-    hist = plt.hist(times, bins=bins, alpha=0.5, **params)
-    plt.xscale("log")
-    params.pop("label")
-    color = params.pop("color")
-    total = integrate_hist(hist, cutoff)
-    if sum(times > cutoff) == 0:
-        return
-    tmean = times[times > cutoff].mean()
-    T = np.logspace(a-3, b, 1000)
-    fT = np.exp(-T/tmean)*T/tmean
-    fT *= total/integrate_values(T, fT, cutoff)
-    plt.plot(T, fT, label="exp. fit, mean = %.2f ms" % (tmean,),
-             color="dark" + color, **params)
-    plt.xlim(10**a, 10**b)
-
-def histogram(rw, a=-3, b=3, scale=1e-0):
-    t = rw.times * 1e-9 / scale # assuming times are in nanosaconds
-
-    exponential_hist(t[rw.success], a, b, color="green", label="translocated")
-    exponential_hist(t[rw.fail], a, b, color="red", label="did not translocate")
-
-    plt.xlabel(r"$\tau$ off [s]")
-    plt.ylabel("count")
-    plt.legend(loc="best")
-
-def hist_poisson(rw, name="attempts", ran=None, n=10, pfit=True, mpfit=True, lines=True):
-    attempts = getattr(rw, name)
-    if ran is None:
-        n0 = 0
-        n1 = n
-    else:
-        n0, n1 = ran
-
-    k = np.arange(n0, n1 + 1)
-    bins = np.arange(n0 - 0.5, n1 + 1.5)
-    
-    astr = "ap = %.3f" if name == "bindings" else "a = %.1f"
-
-    plt.hist(attempts, bins=bins, label="Simulated "+name, color="#aaaaff")
-    # poisson fit
-    a = attempts.mean()
-    K = len(attempts)
-    a0 = attempts[attempts >= 1].mean()
-    a1 = poisson_from_positiveK(a0)
-    print "Mod. Poisson fit, mean of K>0:", a0
-    print "Inferred total mean:", a1
-    print "Standard Poisson fit, mean:", a
-    p1 = a/a1
-    K1 = len(attempts[attempts > 0])/(1.-np.exp(-a1))
-    
-    pdf = K*poisson.pmf(k, a)
-    pdf1 = K*p1*poisson.pmf(k, a1)
-    if n0 == 0:
-        pdf1[0] += K*(1. - p1)
-        
-    k0 = np.linspace(n0, n1, 500)
-    if pfit:
-        if lines:
-            plt.plot(k0, K*gamma.pdf(a, k0 + 1), "-", color="C1")        
-        plt.plot(k, pdf, "s",
-                 label=("Poisson fit, "+astr)%(a), color="C1")
-    if mpfit:
-        if lines:
-            plt.plot(k0, K1*gamma.pdf(a1, k0 + 1), "-", color="C2")
-        plt.plot(k, pdf1, "v",
-                 label=("Mod. Poisson fit, "+astr)%(a1), color="C2")
-    plt.xlim(n0 - 0.5, n1 + 0.5)
-    plt.xticks(k, k)
-    plt.yscale("log")
-    plt.ylim(ymin=1.)
-    plt.xlabel("# %s" % name)
-    plt.ylabel("Count")
-    plt.legend()
-
-def solve_newton(C, f, f1, x0=1., n=20):
-    "solve f(x) == C"
-    x = x0 # initial value
-    print "Newton iteration:"
-    for i in range(n):
-        dx = -(f(x) - C)/f1(x)
-        x = x + dx
-        res = abs(f(x) - C)
-        print i, "Residual", res, "Value", x
-        if res < 1e-12:
-            break
-    print
-    return x
-
-def poisson_from_positiveK(mean):
-    # solve x/(1 - exp(-x)) == mean
-    def f(x):
-        return x/(1. - np.exp(-x))
-    def f1(x):
-        return (np.expm1(x) - x)/(2.*np.cosh(x) - 2.)
-
-    x = solve_newton(mean, f, f1, mean, n=10)
-    return x
-
 def save(ani, name="rw"):
     ani.save(nanopores.HOME + "/presentations/nanopores/%s.mp4" % name,
                  fps=30, dpi=200, writer="ffmpeg_file",
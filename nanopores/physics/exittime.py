@@ -96,6 +96,8 @@ class SurvivalProblem(GeneralLinearProblem):
             L = Constant(0.)*v*dx
         else: # transient case
             # backward euler: (u1 - u)/dt + divJ*(u1) = 0
+            # (Constant, so that changing dt does not trigger recompilation)
+            dt = Constant(dt)
             a = (u1*v - dt*inner(J, grad(u1)))*dx
             L = u*v*dx
         
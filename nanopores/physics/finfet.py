@@ -1,4 +1,5 @@
 import dolfin
+import numpy as np
 #from nanopores.physics.params_physical import *
 from nanopores.physics.default import *
 
@@ -64,20 +65,24 @@ n0 = dict(
 )
 
 def add_dopants(geo, dopants):
+    # marks cells whose midpoint and vertices all lie within rdop of some
+    # dopant, like SubDomain.mark would, but with one KD tree query
+    from scipy.spatial import cKDTree
     rdop = geo.params["rdop"]
-    
-    def dist(x, x0):
-        return dolfin.sqrt(sum((t-t0)**2 for (t,t0) in zip(x,x0))) 
-
-    class Dopants(dolfin.SubDomain):
-        def __init__(self, xi):
-            dolfin.SubDomain.__init__(self)
-            self.xi = xi
-        def inside(self, x, on_boundary):
-            return any(dist(x, x0) <= rdop for x0 in self.xi)
-
-    if dopants is not []:
-        geo.add_subdomain("dopants", Dopants(dopants))
+    mesh = geo.mesh
+    cells = mesh.cells()
+    inside = np.zeros(len(cells), dtype=bool)
+
+    if len(dopants) > 0:
+        tree = cKDTree(np.array(dopants, dtype=float))
+        def near(x):
+            return tree.query(x, distance_upper_bound=2*rdop)[0] <= rdop
+        xv = mesh.coordinates()
+        xc = xv[cells].mean(axis=1)
+        inside = near(xc)
+        inside[inside] = near(xv)[cells[inside]].all(axis=1)
+
+    geo.add_subdomain("dopants", inside)
     return
 
 # TODO: doesn't work    
@@ -618,9 +618,12 @@ class SimpleLinearPBGO(GoalAdaptivePDE):
         self.save_estimate("goal", gl)
         return ind, err
 
-    def adaptive_loop(self, Nmax=1e4, frac=0.2, verbose=True):
+    def adaptive_loop(self, Nmax=1e4, frac=0.2, verbose=True, keep_old=None):
+        # keep_old: number of old mesh levels kept, see Geometry.adapt
         self.maxcells = Nmax
         self.marking_fraction = frac
+        if keep_old is not None:
+            self.geo.keep_old = keep_old
         def printv(*strgs):
             if verbose:
                 for strg in strgs:
@@ -16,8 +16,8 @@ from ..dirnames import DATADIR
 import numpy, os
 #from .calculate_forces import calculate2D
 
-__all__ = ["iterate_in_parallel", "post_iteration", "simulate",
-           "parallel_output"]
+__all__ = ["iterate_in_parallel", "parallel_map", "post_iteration",
+           "simulate", "parallel_output"]
 
 # directory where data are saved
 savedir = DATADIR + "/sim/stamps/"
@@ -58,25 +58,33 @@ def iterate_in_parallel(method, nproc=1, iterkeys=None, **params):
     # create the function to be mapped with
     def f(params): return method(**params)
 
+    result = parallel_map(f, iterator, nproc)
+    if result is None: # MPI process other than 0
+        return None, stamp
+    return join_dicts(result), stamp
+
+def parallel_map(f, input, nproc=1):
+    """map(f, input) preserving the order, distributed over all MPI processes
+    if run with mpirun, or over nproc processes otherwise.
+    with MPI, only process 0 gets the result, the others get None."""
     # map iterator using mpi4py
     # FIXME: doesn't work if some dolfin function are used, e.g. Function.extrapolate
     if MPI.COMM_WORLD.Get_size() > 1:
-        result = mpimap(f, iterator)
+        return mpimap(f, input)
     # map iterator using multiprocessing.Pool
     # FIXME: this approach of distributing across multiple processors is inconvenient
     #        since a single error kills the whole simulation.
     #        (not necessarily, error can be catched and displayed by method)
     #        also it's not supposed to be appropriate for HPC architectures
-    elif nproc>1:
-        pool = mp.Pool(nproc)
-        result = pool.map(f, iterator)
+    elif nproc>1 and len(input)>1:
+        pool = mp.Pool(min(nproc, len(input)))
+        result = pool.map(f, input)
         pool.close()
         pool.join()
+        return result
     # map in serial
     else:
-        result = map(f, iterator)
-
-    return join_dicts(result), stamp
+        return map(f, input)
 
 
 def combinations(dic, iterkeys):
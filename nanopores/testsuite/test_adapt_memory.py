@@ -0,0 +1,87 @@
+"check that Geometry.adapt keeps memory bounded with a retention policy"
+import dolfin
+from dolfin import inner, grad, dx, Constant, FunctionSpace
+from nanopores.tools.geometry import Geometry
+from nanopores.tools.pdesystem import GeneralLinearProblem, LinearPDE
+
+nsteps = 20
+
+def refine_corner(mesh):
+    # refine a few cells only, so that the mesh stays small
+    markers = dolfin.CellFunction("bool", mesh, False)
+    for cell in dolfin.cells(mesh):
+        if cell.midpoint().x() + cell.midpoint().y() < 0.1:
+            markers[cell] = True
+    return dolfin.refine(mesh, markers)
+
+def retained_cells(geo):
+    return sum(mesh.num_cells() for mesh, _, _ in geo.old)
+
+def run(keep_old, keep_parent_maps=False):
+    geo = Geometry(mesh=dolfin.UnitSquareMesh(10, 10))
+    geo.keep_old = keep_old
+    geo.keep_parent_maps = keep_parent_maps
+    geo.pwconst("permittivity", value={"default": 1.})
+    retained = []
+    for i in range(nsteps):
+        geo.adapt(refine_corner(geo.mesh))
+        retained.append(retained_cells(geo))
+    return geo, retained
+
+def test_keep_all():
+    geo, retained = run(None)
+    assert len(geo.old) == nsteps
+    assert retained[-1] > nsteps*retained[0]/2
+
+def test_keep_last():
+    geo, retained = run(2)
+    _, retained_all = run(None)
+    assert len(geo.old) == 2
+    # memory held by old levels does not accumulate over the steps
+    assert all(r <= 2*geo.mesh.num_cells() for r in retained)
+    assert retained[-1] < retained_all[-1]/5
+
+def test_keep_parent_maps():
+    geo, retained = run(0, keep_parent_maps=True)
+    # the last level is kept until forms using it have been adapted
+    assert len(geo.old) == 1
+    assert all(r <= geo.mesh.num_cells() for r in retained)
+    assert len(geo.parent_maps) == nsteps
+    assert len(geo.parent_maps[-1]) == geo.mesh.num_cells()
+    geo.forget_old()
+    assert len(geo.old) == 0
+
+class Poisson(GeneralLinearProblem):
+    @staticmethod
+    def space(mesh):
+        return FunctionSpace(mesh, "CG", 1)
+
+    @staticmethod
+    def forms(V, geo):
+        u = dolfin.TrialFunction(V)
+        v = dolfin.TestFunction(V)
+        return inner(grad(u), grad(v))*dx, Constant(1.)*v*dx
+
+    @staticmethod
+    def bcs(V, geo):
+        return [geo.BC(V, Constant(0.), "boundary")]
+
+def test_solve_keep_none():
+    # adaptation and solving still work when no old level is kept
+    geo = Geometry(mesh=dolfin.UnitSquareMesh(10, 10))
+    pde = LinearPDE(geo, Poisson)
+    pde.geo.keep_old = 0
+    for i in range(5):
+        pde.single_solve()
+        pde.adapt(refine_corner(geo.mesh))
+        assert len(geo.old) == 0
+    pde.single_solve()
+    u = pde.solution
+    # maximum of -laplace u = 1 with zero bc on the unit square
+    assert abs(u.vector().max() - 0.0737) < 5e-3
+
+if __name__ == "__main__":
+    test_keep_all()
+    test_keep_last()
+    test_keep_parent_maps()
+    test_solve_keep_none()
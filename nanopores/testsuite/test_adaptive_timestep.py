@@ -0,0 +1,73 @@
+"check adaptive time stepping on the scalar decay problem u' = -k*u"
+import numpy as np
+import dolfin
+from dolfin import dx, Constant, Function, FunctionSpace
+from nanopores.tools.geometry import Geometry
+from nanopores.tools.pdesystem import GeneralLinearProblem
+from nanopores.tools.transientpde import TransientLinearPDE
+
+k = 2.
+
+class Decay(GeneralLinearProblem):
+    @staticmethod
+    def space(mesh):
+        return FunctionSpace(mesh, "DG", 0)
+
+    @staticmethod
+    def initial_u(V):
+        u = Function(V)
+        u.vector()[:] = 1.
+        return u
+
+    @staticmethod
+    def forms(V, u, dt=None):
+        u1 = dolfin.TrialFunction(V)
+        v = dolfin.TestFunction(V)
+        # backward euler: (u1 - u)/dt = -k*u1
+        a = Constant(1. + k*dt)*u1*v*dx
+        L = u*v*dx
+        return a, L
+
+    @staticmethod
+    def bcs(V):
+        return []
+
+def decay(dt=0.1):
+    geo = Geometry(mesh=dolfin.UnitIntervalMesh(2))
+    return TransientLinearPDE(Decay, geo, dt=dt)
+
+def test_adaptive_timestep():
+    pde = decay()
+    problem = pde.solver.problem
+    t = 0.
+    dts = set()
+    while t < 2.:
+        dt = pde.adaptive_timestep(1e-4)
+        t += dt
+        dts.add(dt)
+        # the solver is left at the time step proposed for the next call
+        assert problem.params["dt"] == pde.dt
+        assert len(pde._dtcache) <= pde.dtcache - 1
+        u = pde.solution.vector().array()
+        assert np.allclose(u, np.exp(-k*t), rtol=0., atol=1e-4)
+    # the step size actually changed, so the matrix cache was used
+    assert len(dts) > 1
+
+    # a plain time step afterwards uses pde.dt
+    u0 = pde.solution.vector().array()
+    pde.timestep()
+    u = pde.solution.vector().array()
+    assert np.allclose(u, u0/(1. + k*pde.dt))
+
+def test_solve_adaptive():
+    pde = decay()
+    pde.solve_adaptive(1., tol=1e-4, verbose=False)
+    t = pde.time[-1]
+    assert t >= 1.
+    assert pde.solver.problem.params["dt"] == pde.dt
+    u = pde.solution.vector().array()
+    assert np.allclose(u, np.exp(-k*t), rtol=0., atol=1e-4)
+
+if __name__ == "__main__":
+    test_adaptive_timestep()
+    test_solve_adaptive()
@@ -0,0 +1,92 @@
+"check that collect_dict resumes a partially saved sweep, also in parallel"
+import os, sys, subprocess, tempfile
+from distutils.spawn import find_executable
+import numpy as np
+from nanopores.tools import fields
+from nanopores.tools.utilities import collect_dict
+
+def setup_module(module):
+    fields.set_dir(tempfile.mkdtemp())
+
+def teardown_module(module):
+    fields.set_dir_default()
+
+def test_resume():
+    X = [(0., 1.), (1., 2.), np.array([2., 3.])]
+    calls = []
+    def f(x):
+        calls.append(tuple(x))
+        return dict(s=x[0] + x[1])
+
+    # interrupted run: one point saved, not yet merged into the header
+    fields.save_fields("sweep", dict(a=1), x=[[0., 1.]], s=[1.])
+
+    result = collect_dict(X, f, name="sweep", params=dict(a=1))
+    assert calls == [(1., 2.), (2., 3.)]
+    assert result["s"] == [1., 3., 5.]
+
+    # everything saved, nothing computed again
+    result = collect_dict(X[::-1], f, name="sweep", params=dict(a=1))
+    assert len(calls) == 2
+    assert result["s"] == [5., 3., 1.]
+
+def test_serial_format():
+    result = collect_dict([1, 2, 3], lambda x: dict(y=x**2, z=-x))
+    assert result == dict(y=[1, 4, 9], z=[-1, -2, -3])
+
+def square(x):
+    return dict(y=x**2)
+
+def test_process_pool():
+    result = collect_dict(range(5), square, nproc=2)
+    assert result["y"] == [0, 1, 4, 9, 16]
+    result = collect_dict(range(5), square, nproc=2, name="pool")
+    assert result["y"] == [0, 1, 4, 9, 16]
+
+mpiscript = """
+import sys
+from mpi4py import MPI
+from nanopores.tools import fields
+from nanopores.tools.utilities import collect_dict
+from nanopores.scripts.simulation2D import iterate_in_parallel
+fields.set_dir(sys.argv[1])
+rank = MPI.COMM_WORLD.Get_rank()
+
+def f(x):
+    return dict(y=x**2, rank=rank)
+
+# the second run finds all points saved
+for i in range(2):
+    result = collect_dict(range(6), f, name="mpi")
+    if rank == 0:
+        assert result["y"] == [0, 1, 4, 9, 16, 25]
+        assert set(result["rank"]) == {0, 1}
+    else:
+        assert result is None
+
+result, stamp = iterate_in_parallel(f, x=range(4))
+if rank == 0:
+    assert result["y"] == [0, 1, 4, 9]
+    print "ok"
+else:
+    assert result is None
+"""
+
+def test_mpi():
+    mpirun = find_executable("mpirun")
+    if mpirun is None:
+        return # needs an MPI installation
+    script = os.path.join(tempfile.mkdtemp(), "mpi_collect_dict.py")
+    with open(script, "w") as f:
+        f.write(mpiscript)
+    out = subprocess.check_output([mpirun, "-n", "2", sys.executable,
+                                   script, tempfile.mkdtemp()])
+    assert "ok" in out
+
+if __name__ == "__main__":
+    setup_module(None)
+    test_resume()
+    test_serial_format()
+    test_process_pool()
+    test_mpi()
+    teardown_module(None)
@@ -0,0 +1,43 @@
+"check fast marching against exact distances on random Delaunay meshes"
+import numpy as np
+from scipy.spatial import Delaunay
+from nanopores.models.eikonal import fast_marching
+
+def random_mesh(dim, n=400, seed=0):
+    # random points in the unit cube plus a grid on the face x = 0
+    np.random.seed(seed)
+    m = int(round(n**(1./dim)))
+    face = np.meshgrid(*([np.linspace(0., 1., m)]*(dim - 1)))
+    face = np.column_stack([np.zeros(face[0].size)] + [f.ravel() for f in face])
+    x = np.vstack([face, np.random.rand(n, dim)])
+    return x, Delaunay(x).simplices
+
+def test_plane_2D():
+    x, cells = random_mesh(2)
+    sources = np.nonzero(x[:, 0] == 0.)[0]
+    d = fast_marching(x, cells, sources)
+    assert np.all(np.isfinite(d))
+    assert np.abs(d - x[:, 0]).max() < 0.02
+
+def test_plane_3D():
+    x, cells = random_mesh(3, n=1000)
+    sources = np.nonzero(x[:, 0] == 0.)[0]
+    d = fast_marching(x, cells, sources)
+    assert np.all(np.isfinite(d))
+    assert np.abs(d - x[:, 0]).max() < 0.02
+
+def test_point_source():
+    for dim, n in [(2, 400), (3, 1000)]:
+        x, cells = random_mesh(dim, n=n, seed=1)
+        source = np.argmin(np.sum((x - 0.5)**2, axis=1))
+        d = fast_marching(x, cells, [source])
+        exact = np.sqrt(np.sum((x - x[source])**2, axis=1))
+        assert d[source] == 0.
+        # distances along the mesh are never shorter than the straight line
+        assert np.all(d >= exact - 1e-12)
+        assert np.abs(d - exact).max() < 0.1
+
+if __name__ == "__main__":
+    test_plane_2D()
+    test_plane_3D()
+    test_point_source()
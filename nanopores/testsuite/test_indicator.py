@@ -0,0 +1,56 @@
+"check vectorized Geometry.indicator and VolumeBC against cellwise loops"
+import numpy as np
+import dolfin
+from nanopores.geometries import pughpore
+
+def indicator_loop(geo, name):
+    t = geo.physicaldomain(name)
+    sub = geo.subdomains
+    chi = dolfin.CellFunction("size_t", geo.mesh, 0)
+    for cell in dolfin.cells(geo.mesh):
+        if sub[cell] in t:
+            chi[cell] = 1
+    return chi
+
+def volumebc_loop(V, geo, name, f):
+    dofmap = V.dofmap()
+    t = geo.physicaldomain(name)
+    sub = geo.subdomains
+    subdofs = set()
+    for i, cell in enumerate(dolfin.cells(geo.mesh)):
+        if sub[cell] in t:
+            subdofs.update(dofmap.cell_dofs(i))
+    subdofs = np.array(sorted(subdofs), dtype="intc")
+    d2v = dolfin.dof_to_vertex_map(V)
+    co = geo.mesh.coordinates()
+    values = np.zeros(V.dim())
+    for dof in subdofs:
+        values[dof] = f(co[d2v[dof]])
+    return subdofs, values
+
+def check(geo):
+    f = lambda x: x[0] + 2.*x[-1]
+    V = dolfin.FunctionSpace(geo.mesh, "CG", 1)
+    for name in ["pore", "dna", "fluid", "molecule"]:
+        chi0 = indicator_loop(geo, name)
+        chi = geo.indicator(name)
+        assert np.all(chi.array() == chi0.array())
+
+        chiDG = geo.indicator(name, DG=True)
+        for cell in dolfin.cells(geo.mesh):
+            assert chiDG(cell.midpoint()) == chi0[cell]
+
+        dofs0, values0 = volumebc_loop(V, geo, name, f)
+        bc = geo.VolumeBC(V, name, f)
+        assert np.all(np.sort(bc.dof_set) == dofs0)
+        assert np.all(bc.bc_f.vector().array() == values0)
+
+def test_indicator_2D():
+    check(pughpore.get_geo_cyl(lc=2., x0=None))
+
+def test_indicator_3D():
+    check(pughpore.get_geo(lc=6., x0=None))
+
+if __name__ == "__main__":
+    test_indicator_2D()
+    test_indicator_3D()
@@ -0,0 +1,47 @@
+"check harmonic interpolation without point data and its operator cache"
+import numpy as np
+import dolfin
+from nanopores.tools.geometry import Geometry
+from nanopores.tools import interpolation
+
+def square():
+    return Geometry(mesh=dolfin.UnitSquareMesh(10, 10))
+
+def test_vector_without_points():
+    geo = square()
+    u = interpolation.harmonic_interpolation_vector(geo,
+            boundaries={"boundary": [1., 2.]})
+    values = u.compute_vertex_values(geo.mesh).reshape(2, -1)
+    assert np.allclose(values[0], 1.)
+    assert np.allclose(values[1], 2.)
+
+def test_cached_data():
+    # new boundary data on a cached operator; u = a*y + 1 is harmonic,
+    # also for the axisymmetric Laplacian used in 2D
+    geo = square()
+    y = geo.mesh.coordinates()[:, 1]
+    for a in 1., 2.:
+        g = dolfin.Expression("%g*x[1] + 1." % a, degree=1)
+        u = interpolation.harmonic_interpolation(geo, boundaries={"boundary": g})
+        assert np.allclose(u.compute_vertex_values(geo.mesh), a*y + 1.,
+                           atol=1e-4)
+    keys = [k for k in interpolation._cache if k[0] == geo.mesh.id()]
+    assert len(keys) == 1
+
+def test_cache_key_depends_on_mesh():
+    geo0 = square()
+    geo1 = Geometry(mesh=geo0.mesh)
+    geo1.boundaries.array()[:] = 0
+    phys = interpolation._setup(geo0)[1]
+    key0 = interpolation._cache_key(geo0, phys, (), {}, {"boundary": 1.})
+    key1 = interpolation._cache_key(geo1, phys, (), {}, {"boundary": 1.})
+    assert key0 != key1
+    # moving vertices keeps mesh.id()
+    geo0.mesh.coordinates()[:] *= 2.
+    key2 = interpolation._cache_key(geo0, phys, (), {}, {"boundary": 1.})
+    assert key2[0] == key0[0] and key2 != key0
+
+if __name__ == "__main__":
+    test_vector_without_points()
+    test_cached_data()
+    test_cache_key_depends_on_mesh()
@@ -0,0 +1,43 @@
+"check that a cached prerefined pughpore mesh is reloaded unchanged"
+import tempfile
+import numpy as np
+import nanopores.models.pughpore as pugh
+from nanopores.tools import solvers
+
+params = dict(dim=2, h=2., Nmax=3e3, x0=None, cheapest=True, imax=10)
+
+meshcache = solvers.MESHCACHE
+
+def setup_module(module):
+    solvers.MESHCACHE = tempfile.mkdtemp()
+
+def teardown_module(module):
+    solvers.MESHCACHE = meshcache
+
+def solve():
+    setup = pugh.Setup(**params)
+    coarse = setup.geo.mesh.num_cells()
+    pb, pnps = pugh.solve(setup)
+    J = pnps.evaluate(setup.phys.CurrentPNPS)["J"]
+    return setup, pb, coarse, J
+
+def test_reload():
+    setup0, pb0, coarse0, J0 = solve()
+    assert pb0 is not None
+    setup1, pb1, coarse1, J1 = solve()
+    # second time, the mesh comes from the cache without refinement
+    assert pb1 is None
+    assert setup1.prerefined
+    assert coarse1 == coarse0
+    geo0, geo1 = setup0.geo, setup1.geo
+    assert geo1.mesh.num_cells() == geo0.mesh.num_cells() > coarse0
+    assert np.all(geo1.subdomains.array() == geo0.subdomains.array())
+    assert np.all(geo1.boundaries.array() == geo0.boundaries.array())
+    # physics lives on the new geometry
+    assert geo1.physics is setup1.phys
+    assert abs(J1 - J0) <= 1e-4*abs(J0)
+
+if __name__ == "__main__":
+    setup_module(None)
+    test_reload()
+    teardown_module(None)
@@ -1,15 +1,19 @@
-from illposed import *
-from errorest import *
-from geometry import *
-from pdesystem import *
-from utilities import *
-from coupled import *
-from physicsclass import *
-from protocol import *
-from mpipool import *
-from transientpde import *
-from box import *
-from axisym import *
-import solvermethods
+from ..lazy import lazy_package as _lazy_package
 
-from solvers import *
+# submodules are imported on first access, see nanopores.lazy
+_lazy_package(__name__, [
+    ".illposed",
+    ".errorest",
+    ".geometry",
+    ".pdesystem",
+    ".utilities",
+    ".coupled",
+    ".physicsclass",
+    ".protocol",
+    ".mpipool",
+    ".transientpde",
+    ".box",
+    ".axisym",
+    (".solvermethods", []),
+    ".solvers",
+])
@@ -18,9 +18,10 @@ note: very naive implementation of union, suitable for a couple 100 boxes
 
 import sys
 import os
+from time import time
 from itertools import izip, product, combinations
 import nanopores.py4gmsh as py4gmsh
-import dolfin
+# dolfin is only needed for meshing and imported there
 
 def printnow(s):
     print s,
@@ -89,7 +90,7 @@ class BoxCollection(object):
             for i in sub.indexset:
                 e = self.entities[d][i]
                 for f, o in izip(_facets(e), orients):
-                    iface = self.entities[d-1].index(f)
+                    iface = self.entity_index(f, d-1)
                     #print odict
                     #print iset
                     #print iface
@@ -113,9 +114,30 @@ class BoxCollection(object):
             sub.indexsets = sub.csg.evalsets()
             sub.indexset = sub.indexsets[d-1]
 
+    def entity_index(self, e, dim):
+        """index of entity e in self.entities[dim].
+        looks up a dict which is extended if entities were appended to the
+        list; entities that are only approximately equal to a list entry
+        (see ExactFloat) are found with list.index as before."""
+        entities = self.entities[dim]
+        if not hasattr(self, "_entity_index"):
+            self._entity_index = {}
+        if dim not in self._entity_index or \
+                self._entity_index[dim][0] is not entities:
+            self._entity_index[dim] = (entities, {}, [0])
+        _, index, n = self._entity_index[dim]
+        if n[0] < len(entities):
+            for i in range(n[0], len(entities)):
+                index.setdefault(entities[i], i)
+            n[0] = len(entities)
+        try:
+            return index[e]
+        except KeyError:
+            return entities.index(e)
+
     def entity_to_gmsh(self, e, dim, lc, gmshself=True):
         # do not duplicate entity in gmsh
-        i = self.entities[dim].index(e)
+        i = self.entity_index(e, dim)
         gmsh_e = self.gmsh_entities[dim][i]
         if gmsh_e is not None:
             return gmsh_e
@@ -271,6 +293,7 @@ class BoxCollection(object):
         return self.geo
 
     def plot(self, sub=False):
+        import dolfin
         geo = self.create_geometry() if not hasattr(self, "geo") else self.geo
         if hasattr(geo, "subdomains"):
             dolfin.plot(geo.subdomains)
@@ -620,6 +643,21 @@ def _unique(seq):
     [unique.append(x) for x in seq if not unique.count(x)]
     return unique
 
+def _unique_sorted(seq):
+    """same as sorted(_unique(seq)) in O(n log n), plus dict that maps every
+    float in seq to the index of its (approximately equal) representative"""
+    order = sorted(range(len(seq)), key=lambda i: float(seq[i]))
+    clusters = []
+    for i in order:
+        if clusters and seq[i] == seq[clusters[-1][0]]:
+            clusters[-1].append(i)
+        else:
+            clusters.append([i])
+    # representative is the first occurrence in seq, like in _unique
+    points = [seq[min(c)] for c in clusters]
+    index = {float(seq[i]): k for k, c in enumerate(clusters) for i in c}
+    return points, index
+
 def _inside_entity(x, entity):
     "test whether point x = (x0,x1,x2) lies in entity"
     for t, e in zip(x, entity):
@@ -642,16 +680,17 @@ def multi_interval_union(intvs):
     # (number of intervals is expected to be smallish, like < 10000)
     # interval := tuple (a,b) with a <= b, a,b are Floats
     # in the case of a == b the interval will be ignored in the final output
-    points = sorted(_unique([x for intv in intvs for x in intv]))
+    points, index = _unique_sorted([x for intv in intvs for x in intv])
     subs = zip(points[:-1], points[1:])
     psets = [set() for i in points]
     ssets = [set() for i in subs]
     for i, intv in enumerate(intvs):
         a, b = intv
-        for j in range(points.index(a), points.index(b)):
+        ia, ib = index[float(a)], index[float(b)]
+        for j in range(ia, ib):
             psets[j].add(i)
             ssets[j].add(i)
-        psets[points.index(b)].add(i)
+        psets[ib].add(i)
     #print points, psets, subs, ssets
     return points, psets, subs, ssets
 
@@ -748,7 +787,18 @@ def entities_to_gmsh(entities, indexsets, esets, lc=.5):
     gmsh_entities = [[None for e in k] for k in entities]
 
     # a shortcut
-    _gmsh = lambda entity, k: gmsh_entities[k][entities[k].index(entity)]
+    index = [dict() for k in entities]
+    for k in range(len(entities)):
+        for i, e in enumerate(entities[k]):
+            index[k].setdefault(e, i)
+    def _index(entity, k):
+        # ExactFloat entries compare equal within a tolerance but hash
+        # exactly, so approximate matches need list.index as before
+        try:
+            return index[k][entity]
+        except KeyError:
+            return entities[k].index(entity)
+    _gmsh = lambda entity, k: gmsh_entities[k][_index(entity, k)]
 
     # add points
     for i, e in enumerate(entities[0]):
@@ -804,6 +854,7 @@ def to_mesh(clscale=1., pid=""):
             pass
 
         import subprocess
+        import dolfin
         import nanopores
         inputfile = "input%s.geo" %pid
         outfile = "out%s.msh" %pid
@@ -854,6 +905,7 @@ def to_mesh(clscale=1., pid=""):
 
 
 def geo_from_meshdir(DIR=MESHDIR):
+    import dolfin
     import nanopores
     mesh = dolfin.Mesh(DIR+"/mesh.xml")
     subdomains = dolfin.MeshFunction("size_t", mesh, DIR+"/mesh_physical_region.xml")
@@ -873,6 +925,6 @@ class Log(object):
         self.msg = msg
     def __enter__(self):
         printnow(self.msg)
-        dolfin.tic()
+        self.t = time()
     def __exit__(self, *args):
-        print "%.2g s" %(dolfin.toc(),)
\ No newline at end of file
+        print "%.2g s" %(time() - self.t,)
\ No newline at end of file
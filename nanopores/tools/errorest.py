@@ -2,7 +2,8 @@ from dolfin import *
 import math, numpy
 
 __all__ = ["edge_residual_indicator", "poisson_indicator", "zz_indicator",
-           "pb_indicator", "Estimator", "pb_indicator_GO", "pb_indicator_GO_cheap"]
+           "pb_indicator", "Estimator", "pb_indicator_GO", "pb_indicator_GO_cheap",
+           "dorfler_marking"]
 
 class Estimator(object):
     ''' object consisting of pairs (N, f(N)) describing convergence of an error or similar '''
@@ -70,6 +71,21 @@ class Estimator(object):
 
 
 
+def _abs(vec):
+    "replace entries of dolfin vector by their absolute values"
+    vec.set_local(numpy.abs(vec.array()))
+    vec.apply("insert")
+
+def dorfler_marking(ind, fraction):
+    """boolean array marking the cells with the largest indicators whose sum
+    is at least fraction times the total (like dolfin's dorfler_mark)"""
+    order = numpy.argsort(ind)[::-1]
+    cumsum = numpy.cumsum(ind[order])
+    n = numpy.searchsorted(cumsum, fraction*cumsum[-1]) + 1 if len(ind) else 0
+    marked = numpy.zeros(len(ind), dtype=bool)
+    marked[order[:n]] = True
+    return marked
+
 def zz_indicator(v,flux=None,dx=None):
     """ v is assumed to be scalar and of piece-wise polynomial degree >= 1 """
     V = v.function_space()
@@ -210,7 +226,7 @@ def pb_indicator_GO(geo, phys, u, z, cyl=False):
     indicators = Function(V)
     vec = indicators.vector()
     assemble(rform(w), tensor=vec)
-    vec[:] = numpy.abs(vec[:])
+    _abs(vec)
 
     goal = J(z)
     goal_ex = J(Ez)
@@ -220,14 +236,14 @@ def pb_indicator_GO(geo, phys, u, z, cyl=False):
 
     error_res = abs(R(z))*scale
     error_rep = abs(R(Ez))*scale
-    error_sum = sum(vec)*scale
+    error_sum = vec.sum()*scale
 
     # cheaper estimator without extrapolation
     indicators2 = Function(V)
     vec2 = indicators2.vector()
     assemble(rform(z), tensor=vec2)
-    vec2[:] = numpy.abs(vec2[:])
-    cheap_sum = sum(vec2)*scale
+    _abs(vec2)
+    cheap_sum = vec2.sum()*scale
     #plotind = plot(indicators2, title="indicator pb GO", elevate=0.0, interactive=True)
 
     # FIXME ?
@@ -301,8 +317,8 @@ def pb_indicator_GO_cheap(geo, phys, u, z, cyl=False):
     indicators = Function(V)
     vec = indicators.vector()
     assemble(rform(z), tensor=vec)
-    vec[:] = numpy.abs(vec[:])
-    error_sum = sum(vec)*scale
+    _abs(vec)
+    error_sum = vec.sum()*scale
     #plotind = plot(indicators2, title="indicator pb GO", elevate=0.0, interactive=True)
 
     print "Goal (dual):", goal
@@ -364,7 +380,7 @@ def simple_pb_indicator_GO(geo, phys, u, z):
     indicators = Function(V)
     vec = indicators.vector()
     assemble(rform(w), tensor=vec)
-    vec[:] = numpy.abs(vec[:])
+    _abs(vec)
 
     # precise relevant scale for error (abs value of functional)
     goal = J(z)
@@ -513,6 +513,10 @@ class Params(dict):
     "for writing params.Qmol instead of params['Qmol']"
     def __getattr__(self, key):
         return self[key]
+    def __or__(self, other):
+        new = Params(self)
+        new.update(other)
+        return new
 
 class CacheBase(object):
     def __init__(self, name, default={}, overwrite=False):
@@ -550,9 +554,11 @@ class cache(CacheBase):
         return result
 
 "caching discrete dolfin functions"
-import dolfin
+# dolfin is imported inside the functions, so that the rest of this module
+# can be used without it
 
 def _save_dolfin(data, FILE):
+    import dolfin
     dolfin.File(str(os.path.join(DIR, FILE))) << data
 
 def save_functions(name, params, **functions):
@@ -592,6 +598,7 @@ def save_functions(name, params, **functions):
     _save(data, FILE)
 
 def _space(mesh, rank):
+    import dolfin
     if rank==0:
         return dolfin.FunctionSpace(mesh, "CG", 1)
     elif rank==1:
@@ -600,9 +607,11 @@ def _space(mesh, rank):
         raise Exception("Loading Functions of rank > 1 is not supported.")
 
 def _load_mesh(FILE):
+    import dolfin
     return dolfin.Mesh(str(os.path.join(DIR, FILE)))
 
 def _load_function(FILE, mesh, rank):
+    import dolfin
     V = _space(mesh, rank)
     return dolfin.Function(V, str(os.path.join(DIR, FILE)))
 
@@ -34,8 +34,7 @@ class Geometry1D(object):
         return u
     
     def function_from_lambda(self, f):
-        values = [f(z) for z in self.Z]
-        return self.function_from_values(values)
+        return self.function_from_values(evaluate(f, self.Z))
     
     def plot(self, u, *args, **kwargs):
         Zlin = self.Zlin
@@ -43,14 +42,26 @@ class Geometry1D(object):
     
     def extend_from(self, f, a0, b0, left=0., right=0.):
         "extend function from smaller interval (a0, b0) to (a,b) by constants."
-        def ff(z):
-            if z > b0:
-                return right
-            elif z < a0:
-                return left
-            else:
-                return f(z)
-        return self.function_from_lambda(ff)
+        Z = self.Z
+        values = numpy.where(Z > b0, float(right), float(left))
+        inside = (Z >= a0) & (Z <= b0)
+        values[inside] = evaluate(f, Z[inside])
+        return self.function_from_values(values)
+
+def evaluate(f, Z):
+    """values of f at all points of the 1D array Z. f is called once with the
+    whole array if it supports that, otherwise once per point."""
+    if not isinstance(f, dolfin.GenericFunction):
+        try:
+            values = numpy.asarray(f(Z), dtype=float)
+        except Exception:
+            pass
+        else:
+            if values.shape == Z.shape:
+                return values
+            if values.shape == ():
+                return numpy.full(Z.shape, float(values))
+    return numpy.vectorize(f, otypes=[float])(Z)
         
 if __name__ == "__main__":
     geo = Geometry1D(0, 2*numpy.pi, 50)
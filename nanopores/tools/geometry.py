@@ -7,6 +7,7 @@ from nanopores.tools.illposed import AdaptableBC, adaptmeshfunction, adaptfuncti
 from nanopores.physics import params_physical
 import dolfin
 import numpy as np
+from scipy.spatial import cKDTree
 
 from importlib import import_module
 import types
@@ -53,6 +54,15 @@ class Geometry(object):
         communication between the two.
         """
 
+    # retention policy for meshes of previous adaptation steps (see adapt):
+    # keep_old = None keeps all of them, keep_old = k keeps the last k.
+    # adapt itself always keeps the last one, PDESystem.adapt trims to
+    # keep_old once its forms live on the new mesh.
+    # with keep_parent_maps = True, the parent cell map of every
+    # adaptation step is stored in self.parent_maps.
+    keep_old = None
+    keep_parent_maps = False
+
     def __init__(self, module=None, mesh=None,
                  #TODO: names are stupid
                  subdomains=None, boundaries=None,
@@ -293,9 +303,16 @@ class Geometry(object):
     def adapt(self,mesh):
         # save history of past meshes and meshfunctions
         # --> to prevent segfaults because the old stuff gets garbage-collected!
+        # how many of them are kept is controlled by self.keep_old; the last
+        # level is always kept here because forms outside the geometry
+        # (e.g. in PDESystem.adapt) still reference it after this call.
         if not hasattr(self, "old"):
             self.old = []
         self.old.append((self.mesh, self.subdomains, self.boundaries))
+        if self.keep_parent_maps:
+            if not hasattr(self, "parent_maps"):
+                self.parent_maps = []
+            self.parent_maps.append(_parent_cells(mesh))
 
         self.mesh = mesh
         #print "subdomain id (geo):",self.subdomains.id()
@@ -323,6 +340,10 @@ class Geometry(object):
                 self.volumes[meas][name].assign(vol)
         #print self.volumes
 
+        # forget old levels only after everything has been adapted
+        if self.keep_old is not None:
+            self.forget_old(max(self.keep_old, 1))
+
         # TODO maybe needed some time
         # adapt self.Physics if we have one
         #if isinstance(self.physics, Physics):
@@ -332,6 +353,26 @@ class Geometry(object):
     # alternative to adapt, should be overwritten dynamically
     rebuild = adapt
 
+    def with_mesh(self, mesh, subdomains, boundaries):
+        """new Geometry with the same physical domains, boundaries, synonymes
+        and params on another mesh with given markers. mesh-dependent state
+        (DG functions, constants, volumes) starts empty."""
+        geo = Geometry(None, mesh, subdomains, boundaries,
+                       dict(self._physical_domain),
+                       dict(self._physical_boundary),
+                       dict(self.synonymes), dict(self.params))
+        if hasattr(self, "curved"):
+            geo.curved = self.curved
+        return geo
+
+    def forget_old(self, keep=None):
+        """drop all but the last keep (default: self.keep_old) old levels.
+        only safe once nothing references them anymore."""
+        if keep is None:
+            keep = self.keep_old
+        if keep is not None and hasattr(self, "old"):
+            del self.old[:max(len(self.old) - keep, 0)]
+
     def import_synonymes(self, synonymes, conservative=False):
         if conservative:
             synonymes.update(self.synonymes)
@@ -363,8 +404,12 @@ class Geometry(object):
                     dic[syn] = tuple(t)
 
     def add_subdomain(self, string, marker):
+        # marker is a SubDomain or a boolean array over cells
         i = max(self._dom2phys.keys()) + 1
-        marker.mark(self.subdomains, i)
+        if isinstance(marker, np.ndarray):
+            self.subdomains.array()[marker] = i
+        else:
+            marker.mark(self.subdomains, i)
         self._physical_domain[string] = (i,)
         self._dom2phys[i] = [string]
 
@@ -382,23 +427,16 @@ class Geometry(object):
         # return "indicator" CellFunction for subdomain
         # set either DG or callable to True to use as function (callable with points)
         t = self.physicaldomain(string)
-        sub = self.subdomains
+        inside = np.in1d(self.subdomains.array(), t)
 
-        if DG: # <-- slow. callable is better
+        if DG:
             D = FunctionSpace(self.mesh, "DG", 0)
-            dofmap = D.dofmap()
             chi = Function(D)
-            chi.vector()[:] = 0
-            for cell in cells(self.mesh):
-                if sub[cell] in t:
-                    i = dofmap.cell_dofs(cell.index())
-                    chi.vector()[i] = 1
+            _set_dofs(chi, _cell_to_dof(D), inside)
             return chi
 
         chi = CellFunction("size_t", self.mesh, 0)
-        for cell in cells(self.mesh):
-            if sub[cell] in t:
-                chi[cell] = 1
+        chi.array()[:] = inside
 
         if callable:
             return CallableMeshFunction(chi)
@@ -414,22 +452,17 @@ class Geometry(object):
         d2v = dof_to_vertex_map(V)
         vertices_on_boundary = d2v[u.vector() == 1.0]
 
-        # DEBUG plot for check
-        '''
-        testf = VertexFunction("bool", mesh, False)
-        testf.array()[vertices_on_boundary] = True
-        R = self.params["rMolecule"]
-        C = self.params["x0"][::2]
-        '''
-
         # snap those vertices
-        for v in vertices_on_boundary:
-            x = mesh.coordinates()[v]
-            #r0 = sqrt((x[0]-C[0])**2 + (x[1]-C[1])**2)
+        if getattr(snap, "vectorized", False):
+            # snap all vertices at once
+            x = mesh.coordinates()[vertices_on_boundary]
             snap(x)
-            #r1 = sqrt((x[0]-C[0])**2 + (x[1]-C[1])**2)
-            #print "DEBUG Radius: %s --> %s" %(r0, r1)
-            mesh.geometry().set(v, x)
+            mesh.coordinates()[vertices_on_boundary] = x
+        else:
+            for v in vertices_on_boundary:
+                x = mesh.coordinates()[v]
+                snap(x)
+                mesh.geometry().set(v, x)
         if smooth:
             mesh.smooth(1)
         #plot(testf, title="after snap")
@@ -471,9 +504,21 @@ class Geometry(object):
         return dom2value
 
     def _dict_to_DG(self, dom2value): #TODO: not assume domain
-        expr = Dict2Expression(dom2value, self.subdomains, degree=1)
-        dgfun = Function(FunctionSpace(self.mesh,'DG',0))
-        dgfun.interpolate(expr)
+        # build DG0 dof vector directly from subdomain markers,
+        # without calling back into python per cell
+        D = FunctionSpace(self.mesh, 'DG', 0)
+        dgfun = Function(D)
+        markers = self.subdomains.array()
+        keys = np.array(dom2value.keys(), dtype="intp")
+        values = np.array([dom2value[k] for k in keys], dtype=float)
+        missing = np.setdiff1d(np.unique(markers), keys)
+        if len(missing) > 0:
+            dolfin_error(__name__+".py",
+                "create piecewise constant",
+                "No value specified for subdomain(s) %s" %(list(missing),))
+        table = np.zeros(max(markers.max(), keys.max()) + 1)
+        table[keys] = values
+        _set_dofs(dgfun, _cell_to_dof(D), table[markers])
         return dgfun
 
     def __str__(self):
@@ -489,13 +534,68 @@ class Geometry(object):
         plot(self.boundaries, **params)
 
 
-class Dict2Expression(Expression): #TODO: too slow... --> compiled expr??
+# DEPRECATED: slow python callback per cell, use Geometry._dict_to_DG
+class Dict2Expression(Expression):
     def __init__(self, dom2value, subdomains, **kwargs):
         self.subdomains = subdomains
         self.dom2value = dom2value
     def eval_cell(self, values, x, cell):
         values[0] = self.dom2value[self.subdomains[cell.index]]
 
+def _owned(u, dofs):
+    """the process-local dofs (as returned by cell_dofs, vertex_to_dof_map)
+    that are owned by this process, i.e. have an entry in u.vector().array().
+    in serial, these are all dofs."""
+    dofs = np.asarray(dofs, dtype="intc")
+    return dofs[dofs < u.vector().local_size()]
+
+def _set_dofs(u, dofs, values):
+    """set values of u at process-local dofs, entries of dofs owned by other
+    processes are skipped (they are set by their owner)"""
+    vec = u.vector()
+    dofs = np.asarray(dofs, dtype="intc")
+    values = np.broadcast_to(np.asarray(values, dtype=float), dofs.shape)
+    owned = dofs < vec.local_size()
+    x = vec.array()
+    x[dofs[owned]] = values[owned]
+    vec.set_local(x)
+    vec.apply("insert")
+
+def _cell_dofs(V, cells=None):
+    "array of shape (number of cells, dofs per cell) with the dofs of each cell"
+    dofmap = V.dofmap()
+    n = dofmap.max_cell_dimension()
+    mesh = V.mesh()
+    dim = mesh.topology().dim()
+    element = V.ufl_element()
+    if element.family() == "Lagrange" and element.degree() == 1:
+        # CG1: dofs of a cell are those of its vertices, ordered by
+        # component first, like in cell_dofs
+        ncomp = max(V.num_sub_spaces(), 1)
+        if n == ncomp*(dim + 1):
+            v2d = dolfin.vertex_to_dof_map(V).reshape(-1, ncomp)
+            cellv = mesh.cells() if cells is None else mesh.cells()[cells]
+            dofs = v2d[cellv].transpose(0, 2, 1).reshape(-1, n)
+            return np.array(dofs, dtype="intc")
+    if cells is None:
+        # for DG spaces all dofs belong to cell interiors, so the dofmap can
+        # return them in one call (not available in older dolfin, where the
+        # method is missing or the SWIG overload does not match)
+        try:
+            if dofmap.num_entity_dofs(dim) == n:
+                dofs = np.array(dofmap.entity_dofs(mesh, dim), dtype="intc")
+                return dofs.reshape(-1, n)
+        except (AttributeError, TypeError, NotImplementedError,
+                RuntimeError):
+            pass
+        cells = range(mesh.num_cells())
+    if len(cells) == 0:
+        return np.zeros((0, n), dtype="intc")
+    return np.array([dofmap.cell_dofs(i) for i in cells], dtype="intc")
+
+def _cell_to_dof(V):
+    "array mapping cell index to the (first) dof of that cell"
+    return _cell_dofs(V)[:, 0]
 
 from numpy import array
 class CallableMeshFunction(object):
@@ -595,23 +695,26 @@ class PointBC(object):
         co = mesh.coordinates()
         dim = co.shape[1]
         dof_map = dolfin.vertex_to_dof_map(V)
-        node_set = set()
-        bc_values = self.bc_f.vector().array()
-        for p, v in zip(points, self.values):
-            wh = np.where(sum((co[:,j] - p[j])**2 for j in range(dim)) < tol)[0]
-            if wh.shape[0]:
-                i = wh[0]
-                bc_values[dof_map[i]] = v
-                node_set.add(i)
-                #print "found:", p
-            else:
-                pass
-                #print "not found:", p
+        if len(points) > 0:
+            # nearest vertex for every point; misses get index len(co)
+            tree = cKDTree(co)
+            X = np.array(points, dtype=float)[:, :dim]
+            dist, ind = tree.query(X, distance_upper_bound=np.sqrt(tol))
+            found = ind < len(co)
+            nodes = ind[found]
+            values = np.array(self.values)[found]
+        else:
+            found = np.zeros(0, dtype=bool)
+            nodes = np.zeros(0, dtype="intc")
+            values = np.zeros(0)
+        node_set = np.unique(nodes)
         print "Found %d of %d points." %(len(node_set), len(points))
 
-        self.bc_f.vector().set_local(bc_values)
-        self.bc_f.vector().apply("insert") # TODO: what does this do?
-        self.dof_set = np.array(dof_map[list(node_set)], dtype="intc")
+        # which points were found and their dofs, to set new values later
+        self.found = found
+        self.point_dofs = dof_map[nodes]
+        _set_dofs(self.bc_f, self.point_dofs, values)
+        self.dof_set = _owned(self.bc_f, dof_map[node_set])
 
     def apply(self, a):
         # Manual application of bcs
@@ -638,31 +741,35 @@ class _VolumeBC(PointBC):
     def __init__(self, V, geo, name, f):
         self.V = V
         # get dofs lying in subdomain
-        dofmap = V.dofmap()
         tup = geo.physicaldomain(name)
         sub = geo.subdomains
         mesh = geo.mesh
 
-        subdofs = set()
-        for i, cell in enumerate(dolfin.cells(mesh)):
-            if sub[cell] in tup:
-                celldofs = dofmap.cell_dofs(i)
-                subdofs.update(celldofs)
-
-        subdofs = np.array(list(subdofs), dtype="intc")
+        subcells = np.where(np.in1d(sub.array(), tup))[0]
+        bc_f = dolfin.Function(V)
+        subdofs = _owned(bc_f, np.unique(_cell_dofs(V, subcells)))
         d2v = dolfin.dof_to_vertex_map(V)
         co = mesh.coordinates()
 
         # create function with desired values
-        # could also be implemented with Expression.eval_cell like pwconst
-        bc_f = dolfin.Function(V)
-        for dof in subdofs:
-            x = co[d2v[dof]]
-            bc_f.vector()[dof] = f(x)
+        # f is either a callable of points or a dolfin function
+        if isinstance(f, dolfin.GenericFunction):
+            values = dolfin.interpolate(f, V).vector().array()[subdofs]
+        else:
+            values = [f(y) for y in co[d2v[subdofs]]]
+        _set_dofs(bc_f, subdofs, values)
         self.bc_f = bc_f
         self.dof_set = subdofs
 
 
+def _parent_cells(mesh):
+    "parent cell of every cell after refinement, or None if not available"
+    data = mesh.data()
+    dim = mesh.topology().dim()
+    if not data.exists("parent_cell", dim):
+        return None
+    return np.array(data.array("parent_cell", dim), dtype="intc")
+
 def _wrapf(f):
 # takes either Function/uflExpression or float/tuple and wraps with Constant in the latter case
 # for easy specification of Dirichlet or Neumann data
@@ -42,6 +42,7 @@ class IllposedLinearSolver(object):
         #print ("Process %s: I'm assembling a system of size %s now!" %
         #      (mpi4py.MPI.COMM_WORLD.Get_rank(), self.problem.u.function_space().dim()))
         #print "DEBUG, form:\n", self.problem.a
+        self.b = None # right-hand side tensor, reused while A is
         A = assemble(self.problem.a, keep_diagonal=True)
         for bc in self.problem.bcs:
             bc.apply(A)
@@ -113,7 +114,11 @@ class IllposedLinearSolver(object):
         u = self.problem.u
         #plot(u.sub(0))
         if(not(self.method["reuse"])): self.assemble_A()
-        b = assemble(self.problem.L)
+        if self.b is None:
+            self.b = assemble(self.problem.L)
+        else:
+            assemble(self.problem.L, tensor=self.b)
+        b = self.b
         for bc in self.problem.bcs:
             bc.apply(b)
         #print ("Process %s: I'm solving a system of size %s now!" %
@@ -1,5 +1,7 @@
 # (c) 2016 Gregor Mitscha-Baude
 "harmonic interpolation."
+from collections import OrderedDict
+import hashlib
 import numpy as np
 import dolfin
 from nanopores.tools.geometry import PointBC, Geometry
@@ -8,8 +10,14 @@ from nanopores.tools.physicsclass import Physics
 # TODO: add points in 3D
 # TODO: better use iterative solver for laplace
 
-def harmonic_interpolation(setup, points=(), values=(),
-                           subdomains=dict(), boundaries=None):
+# assembled Laplace operators (with constrained rows), their solvers and the
+# constrained dofs, so that repeated calls with different Dirichlet data only
+# set the new values and solve. keyed by mesh (vertex coordinates and
+# markers) and by which points, subdomains and boundaries are fixed.
+_cache = OrderedDict()
+cache_size = 10
+
+def _setup(setup):
     if isinstance(setup, Geometry):
         geo = setup
         phys = Physics(geo=geo)
@@ -17,41 +25,166 @@ def harmonic_interpolation(setup, points=(), values=(),
     else:
         geo = setup.geo
         phys = setup.phys
-    mesh = geo.mesh
-
-    # Laplace equation
-    V = dolfin.FunctionSpace(mesh, "CG", 1)
-    u = dolfin.TrialFunction(V)
-    v = dolfin.TestFunction(V)
-    a = dolfin.inner(dolfin.grad(u), dolfin.grad(v))*phys.r2pi*geo.dx()
-    L = dolfin.Constant(0.)*v*phys.r2pi*geo.dx()
-
+    return geo, phys
+
+def _mesh_hash(geo):
+    # vertices can be moved (e.g. by snap_to_boundary) and markers can differ
+    # between geometries on the same mesh or be changed in place (e.g. by
+    # Geometry.add_subdomain), all without changing mesh.id()
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(geo.mesh.coordinates()).tostring())
+    for f in geo.subdomains, geo.boundaries:
+        h.update(np.ascontiguousarray(f.array()).tostring())
+    return h.hexdigest()
+
+def _cache_key(geo, phys, points, subdomains, boundaries):
+    return (geo.mesh.id(), _mesh_hash(geo), bool(phys.cyl),
+            np.array(points, dtype=float).tostring(),
+            tuple(sorted(subdomains)),
+            None if boundaries is None else tuple(sorted(
+                k for k in boundaries if boundaries[k] is not None)))
+
+def _bcs(geo, V, points, values, subdomains, boundaries):
+    "list of (kind, name, bc)"
     # Point-wise boundary condition
-    bc = PointBC(V, points, values)
-    bcs = [bc]
+    bcs = [("points", None, PointBC(V, points, values))]
 
     # Volume boundary conditions
-    for sub, f in subdomains.items():
-        bc = geo.VolumeBC(V, sub, f)
-        bcs.append(bc)
+    for sub in sorted(subdomains):
+        bcs.append(("subdomain", sub, geo.VolumeBC(V, sub, subdomains[sub])))
 
     # Normal boundary conditions
     if boundaries is not None:
-        bc = geo.pwBC(V, "", value=boundaries)
-        bcs.extend(bc)
+        for bou in sorted(boundaries):
+            for bc in geo.pwBC(V, "", value={bou: boundaries[bou]}):
+                bcs.append(("boundary", bou, bc))
+    return bcs
+
+def _constraints(geo, V, bcs):
+    """(kind, name, dofs, data) for every bc: the locally owned dofs it fixes
+    and what is needed to get their values from new data (found points, or
+    dof coordinates of a subdomain)"""
+    size = dolfin.Function(V).vector().local_size()
+    constraints = []
+    for kind, name, bc in bcs:
+        if kind == "points":
+            owned = bc.point_dofs < size
+            data = np.nonzero(bc.found)[0][owned]
+            dofs = bc.point_dofs[owned]
+        elif kind == "subdomain":
+            dofs = bc.dof_set
+            data = geo.mesh.coordinates()[dolfin.dof_to_vertex_map(V)[dofs]]
+        else:
+            dofs = []
+            for dbc in bc.bcs:
+                dofs.extend(dbc.get_boundary_values().keys())
+            dofs = np.array(dofs, dtype="intc")
+            dofs = dofs[dofs < size]
+            data = None
+        constraints.append((kind, name, dofs, data))
+    return constraints
+
+def _values(f, V, dofs, coordinates=None):
+    # f is a dolfin function, a callable of points or a number
+    if isinstance(f, dolfin.GenericFunction):
+        return dolfin.interpolate(f, V).vector().array()[dofs]
+    if coordinates is None:
+        return float(f)
+    return [f(y) for y in coordinates]
+
+def _rhs(V, constraints, points, values, subdomains, boundaries):
+    "homogeneous RHS, only the constrained dofs get (new) values"
+    b = dolfin.Function(V).vector()
+    x = b.array()
+    if callable(values):
+        values = [values(p) for p in points]
+    # same order as applying the bcs, later ones win
+    for kind, name, dofs, data in constraints:
+        if kind == "points":
+            x[dofs] = np.array(values, dtype=float)[data]
+        elif kind == "subdomain":
+            x[dofs] = _values(subdomains[name], V, dofs, data)
+        else:
+            x[dofs] = _values(boundaries[name], V, dofs)
+    b.set_local(x)
+    b.apply("insert")
+    return b
+
+def _assemble_solver(geo, phys, V, bcs):
+    # Laplace equation
+    u = dolfin.TrialFunction(V)
+    v = dolfin.TestFunction(V)
+    a = dolfin.inner(dolfin.grad(u), dolfin.grad(v))*phys.r2pi*geo.dx()
 
-    # Assemble, apply bc and solve
-    A, b = dolfin.assemble_system(a, L)
+    # Assemble and apply bc
+    A = dolfin.assemble(a)
     for bc in bcs:
         bc.apply(A)
-        bc.apply(b)
 
-    u = dolfin.Function(V)
-    dolfin.solve(A, u.vector(), b, "bicgstab", "hypre_euclid")
+    # operator is fixed, so the preconditioner is only built at the first solve
+    solver = dolfin.PETScKrylovSolver("bicgstab", "hypre_euclid")
+    solver.set_operator(A)
 #    if phys.cyl:
-#        dolfin.solve(A, u.vector(), b, "bicgstab", "hypre_euclid")
+#        solver = dolfin.PETScKrylovSolver("bicgstab", "hypre_euclid")
 #    else:
-#        dolfin.solve(A, u.vector(), b, "cg", "hypre_amg")
+#        solver = dolfin.PETScKrylovSolver("cg", "hypre_amg")
+    return solver
+
+def _solve(geo, phys, key, points, values, subdomains, boundaries):
+    if key in _cache:
+        V, solver, constraints = _cache[key]
+        b = _rhs(V, constraints, points, values, subdomains, boundaries)
+    else:
+        V = dolfin.FunctionSpace(geo.mesh, "CG", 1)
+        bcs = _bcs(geo, V, points, values, subdomains, boundaries)
+        solver = _assemble_solver(geo, phys, V, [bc for _, _, bc in bcs])
+        _cache[key] = (V, solver, _constraints(geo, V, bcs))
+        while len(_cache) > cache_size:
+            _cache.popitem(last=False)
+        # homogeneous RHS, only bcs contribute
+        b = dolfin.Function(V).vector()
+        for _, _, bc in bcs:
+            bc.apply(b)
+
+    u = dolfin.Function(V)
+    solver.solve(u.vector(), b)
+    return u
+
+def harmonic_interpolation(setup, points=(), values=(),
+                           subdomains=dict(), boundaries=None):
+    geo, phys = _setup(setup)
+    key = _cache_key(geo, phys, points, subdomains, boundaries)
+    return _solve(geo, phys, key, points, values, subdomains, boundaries)
+
+def harmonic_interpolation_vector(setup, points=(), values=(),
+                                  subdomains=dict(), boundaries=None):
+    """harmonic interpolation of all components of a vector field.
+    the components are solved one after another, but share one assembled
+    Laplace operator. values is an array with one column per component,
+    subdomains and boundaries map names to lists with one entry per component.
+    returns a CG1 vector Function."""
+    geo, phys = _setup(setup)
+    key = _cache_key(geo, phys, points, subdomains, boundaries)
+
+    if len(points) > 0:
+        values = np.array(values, dtype=float).reshape(len(points), -1)
+        dim = values.shape[1]
+    else:
+        data = list(subdomains.values()) + (
+               list(boundaries.values()) if boundaries is not None else [])
+        dim = len(data[0])
+        values = np.zeros((0, dim))
+
+    U = []
+    for i in range(dim):
+        sub = {k: f[i] for k, f in subdomains.items()}
+        bou = None if boundaries is None else {
+              k: f[i] for k, f in boundaries.items()}
+        U.append(_solve(geo, phys, key, points, values[:, i], sub, bou))
+
+    VV = dolfin.VectorFunctionSpace(geo.mesh, "CG", 1, dim=dim)
+    u = dolfin.Function(VV)
+    dolfin.assign(u, U)
     return u
 
 def harmonic_interpolation_simple(mesh, points, values):
@@ -27,8 +27,11 @@ class PDESystem(object):
         self.solvers = solvers
         self.functionals = functionals
 
-    def solve(self, refinement=False, verbose=True, inside_loop=_pass):
-
+    def solve(self, refinement=False, verbose=True, inside_loop=_pass,
+              keep_old=None):
+        # keep_old: number of old mesh levels kept during refinement
+        if keep_old is not None:
+            self.geo.keep_old = keep_old
         if verbose:
             print "Number of cells:",self.geo.mesh.num_cells()
         if self.geo.mesh.num_cells() > self.maxcells:
@@ -112,20 +115,19 @@ class PDESystem(object):
         markers = CellFunction("bool", mesh, True)
         if not self.uniform_refinement and not self.marking_fraction == 1.:
             #tic()
-            indicators = CellFunction("double", mesh)
+            from .geometry import _cell_to_dof
             # ind is a DG0 Function
-            dofmap = ind.function_space().dofmap()
-            cell_to_dof = numpy.array([dofmap.cell_dofs(i)[0] for i in range(mesh.num_cells())])
-            indicators.array()[:] = ind.vector()[cell_to_dof]
-            
-            # This version is about 30x slower than the one above:
-            # (and only about 0.5x faster than the refine() step
-            #  which should dominate this function)
-            #for c in cells(mesh):
-            #    indicators[c] = ind(c.midpoint())
-            #print "TIME DG0 -> CellFunction: %s s" % (toc(),)
+            indicators = ind.vector().array()[_cell_to_dof(ind.function_space())]
+            #print "TIME DG0 -> cell array: %s s" % (toc(),)
             #tic()
-            dorfler_mark(markers, indicators, self.marking_fraction)
+            if MPI.size(mesh.mpi_comm()) == 1:
+                markers.array()[:] = dorfler_marking(indicators,
+                                                     self.marking_fraction)
+            else:
+                # marking fraction refers to the global sum
+                indfunc = CellFunction("double", mesh)
+                indfunc.array()[:] = indicators
+                dorfler_mark(markers, indfunc, self.marking_fraction)
             #print "TIME Marking: %s s" % (toc(),)
         #tic()
 
@@ -158,6 +160,9 @@ class PDESystem(object):
                 J.adapt(mesh)
                 J.replace(functions,functions)
 
+        # now nothing refers to the previous level anymore
+        self.geo.forget_old()
+
     def rebuild(self, mesh):
         """ Assumes geometry to have geo.rebuild """
         functionals = self.functionals
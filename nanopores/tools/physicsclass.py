@@ -3,7 +3,7 @@
 #from .utilities import import_vars
 from collections import defaultdict
 from importlib import import_module
-import inspect
+import copy, inspect, weakref
 
 __all__ = ["Physics"]
 
@@ -17,6 +17,29 @@ type(inspect): "module",
 })
 def typestr(t): return d[type(t)]
 
+# public module variables as first imported, per physics module.
+# module variables are overwritten by user parameters in Physics.__init__,
+# so every instance restores them from here (this replaces reload(mod))
+_defaults = {}
+
+def _module_defaults(mod):
+    if mod not in _defaults:
+        vardic = vars(mod)
+        _defaults[mod] = {k: vardic[k] for k in vardic if not k.startswith("_")}
+    return _defaults[mod]
+
+def _fresh(v):
+    "copy of mutable defaults (maps and lists like dopants, toadapt)"
+    return copy.copy(v) if isinstance(v, (dict, list)) else v
+
+_argspecs = weakref.WeakKeyDictionary()
+
+def _argnames(f):
+    "cached argument names of physics function f"
+    if f not in _argspecs:
+        _argspecs[f] = inspect.getargspec(f).args
+    return _argspecs[f]
+
 class Physics(object):
 
     def __init__(self, name="default", geo=None, module=None, **params):
@@ -26,10 +49,12 @@ class Physics(object):
         else:
             name = "nanopores.physics."+name
             mod = import_module(name)
-        mod = reload(mod)
         #var = import_vars(name)
-        vardic = vars(mod)
-        var = {k: vardic[k] for k in vardic if not k.startswith("_")}
+        default = _module_defaults(mod)
+        # copy dicts and lists, so that instances, the module and the stored
+        # defaults never share mutable state (as with the former reload(mod))
+        vars(mod).update({k: _fresh(v) for k, v in default.items()})
+        var = {k: _fresh(v) for k, v in default.items()}
         #print var
 
         # override with user-specified parameters
@@ -74,8 +99,7 @@ class Physics(object):
 
     def precalculate(self, mod):
         for fstr, f in self.functions.items():
-            argnames = inspect.getargspec(f).args
-            args = [self.base[k] for k in argnames]
+            args = [self.base[k] for k in _argnames(f)]
             self.base[fstr] = f(*args)
             #setattr(mod, fstr, self.base[fstr])
 
@@ -92,8 +116,7 @@ class Physics(object):
             
         elif name in self.functions:
             f = self.functions[name] #.pop(name)
-            argnames = inspect.getargspec(f).args
-            args = [getattr(self, k) for k in argnames]
+            args = [getattr(self, k) for k in _argnames(f)]
             result = f(*args)
             self.base[name] = result
             #setattr(self.mod, name, result)
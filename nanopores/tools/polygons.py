@@ -6,9 +6,8 @@ only the pore protein crosssection and parameters have to be plugged in."""
 import numpy as np
 from bisect import bisect
 from collections import OrderedDict
-from matplotlib import pyplot as plt
 import matplotlib.path as mpath
-from nanopores.tools.utilities import Params
+from nanopores.tools.fields import Params
 
 # convention:
 # a - b - c - d numbering of polygon corners
@@ -25,6 +24,9 @@ def irange(i0, i1, n, sign=1):
 
 class Polygon(object):
     TOL = 0.1
+    # if set to n > 0, winding_number first looks up points in a n x n grid
+    # over the bounding box and only does the exact test near edges
+    gridsize = None
 
     def __init__(self, nodes):
         self.nodes = [(float(x[0]), float(x[1])) for x in nodes]
@@ -42,18 +44,32 @@ class Polygon(object):
     def init_edges(self):
         nodes = self.nodes
         self.edges = zip(nodes, nodes[1:] + nodes[0:1])
+        self.clear_cache()
 
-    def inside(self, x, radius=0., newpath=False):
+    def clear_cache(self):
+        "has to be called whenever nodes or edges are modified"
+        for attr in ("path", "_edge_arrays", "_grid"):
+            self.__dict__.pop(attr, None)
+
+    def get_path(self, newpath=False):
         if newpath or not hasattr(self, "path"):
             self.path = mpath.Path(np.array(self.nodes[::-1]), closed=True)
+        return self.path
+
+    def edge_arrays(self):
+        "start and end points of all edges as two (M, 2) arrays"
+        if not hasattr(self, "_edge_arrays"):
+            E = np.array([(e[0], e[-1]) for e in self.edges], dtype=float)
+            self._edge_arrays = E[:, 0, :], E[:, 1, :]
+        return self._edge_arrays
+
+    def inside(self, x, radius=0., newpath=False):
         #return np.array([self.path.contains_point(t) for t in x])
-        return self.path.contains_points(x, radius=radius)
+        return self.get_path(newpath).contains_points(x, radius=radius)
 
     def inside_single(self, x, radius=0., newpath=False):
         x = np.array([np.sqrt(x[0]**2 + x[1]**2), x[2]])
-        if newpath or not hasattr(self, "path"):
-            self.path = mpath.Path(np.array(self.nodes[::-1]), closed=True)
-        return self.path.contains_point(x, radius=radius)
+        return self.get_path(newpath).contains_point(x, radius=radius)
         #return self.path.contains_points(np.array([x]), radius=radius)[0]
         
     def inside_winding(self, r, z):
@@ -192,12 +208,14 @@ class Polygon(object):
             # replace edge x-y with x-v and insert v-y
             self.edges[i-1] = (x, v)
             self.edges.insert(i, (v, y))
+        self.clear_cache()
         #self.init_edges()
 
     def close(self, x, y):
         return sum((t - s)**2 for t, s in zip(x, y)) < self.TOL**2
 
     def plot(self, *args, **kwargs):
+        from matplotlib import pyplot as plt
         #plt.figure()
         x0, x1 = zip(*(self.nodes + [self.nodes[0]]))
         plt.plot(x0, x1, *args, **kwargs)
@@ -259,6 +277,7 @@ class Polygon(object):
             #print i
             self.nodes.remove(nodes[i])
             self.edges.remove(edges[i])
+        self.clear_cache()
 
     def cut_from_right(self, r):
         # TODO: fails if cut polygon is not connected any more
@@ -403,6 +422,7 @@ class MultiPolygon(Polygon):
                 if e0 in b:
                     b.remove(e0)
                     b |= {u.edges[i-1], u.edges[i]}
+        self.clear_cache()
 
     def all_intersections(self, z, axis=1):
         X = Polygon.all_intersections(self, z, axis)
@@ -967,18 +987,58 @@ implemented for array of points at once."""
 
 def winding_number(poly, x):
     "return array of winding numbers of poly around points x"
-    wn = np.zeros(x.shape[0], dtype=int)
-    for e in poly.edges:
-        v0, v1 = e
-        lor = left_on_right(v0, v1, x)
-        is_left = lor > 0
-        is_right = lor < 0
-        upward_crossing = (v0[1] <= x[:, 1]) & (v1[1] > x[:, 1])
-        downward_crossing = (v0[1] > x[:, 1]) & (v1[1] <= x[:, 1])
-        wn[upward_crossing & is_left] += 1
-        wn[downward_crossing & is_right] -= 1
+    x = np.asarray(x, dtype=float)
+    if not poly.gridsize:
+        return _winding_number(poly, x)
+
+    # points in grid cells away from all edges get the winding number of
+    # the cell center, only the rest is tested exactly
+    lo, hi, h, near, gridwn = _winding_grid(poly)
+    n = near.shape[0]
+    outside = np.any((x < lo) | (x > hi), axis=1)
+    I = np.clip(np.floor((x - lo)/h).astype(int), 0, n - 1)
+    I = I[:, 0], I[:, 1]
+    exact = near[I] & ~outside
+    wn = np.where(outside, 0, gridwn[I])
+    if np.any(exact):
+        wn[exact] = _winding_number(poly, x[exact])
+    return wn
+
+def _winding_number(poly, x):
+    # all edges against all points in one broadcasted operation
+    V0, V1 = poly.edge_arrays()
+    v0x, v0y = V0[:, 0], V0[:, 1]
+    v1x, v1y = V1[:, 0], V1[:, 1]
+    px, py = x[:, 0:1], x[:, 1:2]
+    lor = (v1x - v0x)*(py - v0y) - (px - v0x)*(v1y - v0y)
+    upward_crossing = (v0y <= py) & (v1y > py)
+    downward_crossing = (v0y > py) & (v1y <= py)
+    wn = np.sum(upward_crossing & (lor > 0), axis=1) - \
+         np.sum(downward_crossing & (lor < 0), axis=1)
     return -wn # minus because winding convention of edges is wrong
 
+def _winding_grid(poly):
+    n = poly.gridsize
+    if hasattr(poly, "_grid") and poly._grid[3].shape[0] == n:
+        return poly._grid
+    V0, V1 = poly.edge_arrays()
+    X = np.vstack([V0, V1])
+    lo, hi = X.min(0), X.max(0)
+    h = (hi - lo)/n
+    h[h == 0.] = 1.
+
+    # mark cells touched by edge bounding boxes, plus one layer for safety
+    near = np.zeros((n, n), dtype=bool)
+    I0 = np.floor((np.minimum(V0, V1) - lo)/h).astype(int) - 1
+    I1 = np.floor((np.maximum(V0, V1) - lo)/h).astype(int) + 2
+    for (i0, j0), (i1, j1) in zip(np.maximum(I0, 0), I1):
+        near[i0:i1, j0:j1] = True
+
+    centers = lo + (np.indices((n, n)).reshape(2, -1).T + .5)*h
+    gridwn = _winding_number(poly, centers).reshape(n, n)
+    poly._grid = lo, hi, h, near, gridwn
+    return poly._grid
+
 def left_on_right(v0, v1, x):
     """tests whether point x is left (output>0), on (=0), or right (<0)
     of the infinite line defined by v0, v1. x is many points as (N, 2) array"""
@@ -1008,6 +1068,7 @@ def union_example():
 
 
 def plot_edges(edges, *args, **kwargs):
+    from matplotlib import pyplot as plt
     for t in edges:
         if len(t) == 3:
             x, _, y = t
@@ -1016,6 +1077,7 @@ def plot_edges(edges, *args, **kwargs):
         plt.plot([x[0], y[0]], [x[1], y[1]], *args, **kwargs)
 
 if __name__ == "__main__":
+    from matplotlib import pyplot as plt
     from nanopores.geometries.alphahempoly import poly
     params = dict(
         R = 4.1,
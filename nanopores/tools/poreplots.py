@@ -29,8 +29,6 @@ def streamlines(polygon=None, patches=None, R=10., Htop=10., Hbot=10.,
     Ny += 1
     Nx += 1
     Y, X = np.mgrid[-Hbot:Htop:Ny*1j, -R:R:Nx*1j]
-    U = np.zeros((Ny,Nx))
-    V = np.zeros((Ny,Nx))
     formt = matplotlib.ticker.FuncFormatter(exp_format)
     ticks = [0] + [10**n for n in range(-15, -8)]
 
@@ -43,12 +41,8 @@ def streamlines(polygon=None, patches=None, R=10., Htop=10., Hbot=10.,
         Fstr = fields.keys()[i]
         fig, ax = plt.subplots(num=Fstr, figsize=figsize)
 
-        # fill array with function values
-        for y in range(Ny):
-            for x in range(Nx):
-                f = F(X[y][x], Y[y][x])
-                U[y][x] = f[0]
-                V[y][x] = f[1]
+        # fill array with function values, masked outside the mesh
+        U, V = nanopores.evaluate2D(F, X, Y)
 
         # streamplot with logarithmic scale
         strength = np.sqrt(U*U+V*V)
@@ -1,14 +1,22 @@
 # (c) 2016 Gregor Mitscha-Baude
 "handle complex PDE solvers and parallel force evaluation"
-import traceback
+import os, json, hashlib, traceback
+from nanopores.dirnames import DATADIR
 from nanopores.scripts.simulation2D import iterate_in_parallel
 from nanopores.tools.utilities import Params
 from nanopores.tools import fields
 __all__ = ["Setup", "calculate_forcefield", "cache_forcefield"]
 
+MESHCACHE = os.path.join(DATADIR, "meshes", "prerefined")
+
 class Setup(object):
     "handle input parameters and setup geometry"
     default = {}
+    # prerefined meshes are cached under a hash of geop, physp and these
+    # solver parameters; set cache_prerefined = False to always recompute
+    cache_prerefined = True
+    prerefine_params = ("h", "Nmax", "frac", "cheapest")
+    prerefined = False
 
     def __init__(self, geop=None, physp=None, solverp=None, **params):
         self.init_params(params, geop=geop, physp=physp, solverp=solverp)
@@ -35,6 +43,68 @@ class Setup(object):
     def init_phys(self):
         self.phys = None
 
+    def prerefine_key(self):
+        "hash of all parameters that determine the prerefined mesh"
+        solverp = {k: self.solverp[k] for k in self.prerefine_params
+                   if k in self.solverp}
+        # model identity, so that different Setups with equal parameters
+        # do not share meshes
+        cls = type(self)
+        geoname = None
+        if self.geo is not None:
+            geoname = self.geo.params.get("name")
+        params = dict(geop=self.geop, physp=self.physp, solverp=solverp,
+                      model=cls.__module__ + "." + cls.__name__,
+                      geoname=geoname)
+        string = json.dumps(params, sort_keys=True, default=repr)
+        return hashlib.sha1(string).hexdigest()
+
+    def _prerefine_files(self):
+        prefix = os.path.join(MESHCACHE, self.prerefine_key())
+        return [prefix + "_%s.xml.gz" %s
+                for s in ("mesh", "subdomains", "boundaries")]
+
+    def load_prerefined(self):
+        """replace self.geo by a geometry on the cached prerefined mesh and
+        rebuild self.phys on it. called by prerefine, so geo and phys taken
+        from the setup before have to be fetched again afterwards."""
+        self.prerefined = False
+        if not self.cache_prerefined or self.geo is None:
+            return False
+        files = self._prerefine_files()
+        if not all(os.path.exists(f) for f in files):
+            return False
+        import dolfin
+        mesh = dolfin.Mesh(files[0])
+        subdomains = dolfin.MeshFunction("size_t", mesh, files[1])
+        boundaries = dolfin.MeshFunction("size_t", mesh, files[2])
+        # new geometry, so that no mesh-dependent state of the coarse one
+        # (DG functions, constants, volumes) survives
+        self.geo = self.geo.with_mesh(mesh, subdomains, boundaries)
+        self.init_phys()
+        self.prerefined = True
+        print "Loaded prerefined mesh (%d cells) from cache." %(
+            mesh.num_cells(),)
+        return True
+
+    def save_prerefined(self):
+        "store the current mesh and markers of self.geo in the cache"
+        if not self.cache_prerefined:
+            return
+        import dolfin
+        if not os.path.exists(MESHCACHE):
+            os.makedirs(MESHCACHE)
+        files = self._prerefine_files()
+        objects = [self.geo.mesh, self.geo.subdomains, self.geo.boundaries]
+        # every file is written under a temporary name and then renamed,
+        # so load_prerefined never sees partially written files
+        for FILE, obj in zip(files, objects):
+            head, tail = os.path.split(FILE)
+            TMP = os.path.join(head, "tmp%d_%s" %(os.getpid(), tail))
+            dolfin.File(TMP) << obj
+            os.rename(TMP, FILE)
+        self.prerefined = True
+
 def calculate_forcefield(name, X, calculate, params={}, default={}, nproc=1,
                          overwrite=False):
     "assuming function calculate([x0], **params)"
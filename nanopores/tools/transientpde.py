@@ -1,6 +1,7 @@
 """ PDE class for time-dependent systems """
 
 import dolfin
+from collections import OrderedDict
 from .pdesystem import PDESystem
 from .illposed import IllposedLinearSolver
 import matplotlib.pyplot as plt
@@ -27,6 +28,7 @@ def logtimerange(T0, levels, frac=0.01, mult=10, change_dt=None):
 
 class TransientLinearPDE(PDESystem):
     dt = 1 # default time step [s]
+    dtcache = 3 # max. number of matrices kept for adaptive time stepping
 
     def __init__(self, Problem, geo=None, phys=None,
                  dt=None, **problem_params):
@@ -39,6 +41,13 @@ class TransientLinearPDE(PDESystem):
         # i don't think there's any need for storing two functions
         problem = Problem(geo=geo, phys=phys, dt=dt, **problem_params)
         solver = IllposedLinearSolver(problem)
+        # the matrix only changes with dt, so it is assembled (and factorized)
+        # once and every time step only reassembles the right-hand side
+        if not solver.method["reuse"]:
+            luparams = dict(solver.method.get("luparams", {}),
+                            reuse_factorization=True)
+            solver.method = dict(solver.method, reuse=True, luparams=luparams)
+            solver.assemble_A()
 
         self.geo = geo
         self.functions = {Problem.__name__: problem.solution()}
@@ -51,11 +60,81 @@ class TransientLinearPDE(PDESystem):
         self.dt = dt
         # needs problem.update_forms
         for solver in self.solvers.values():
+            if solver.problem.params.get("dt") == dt:
+                continue # matrix is still valid
             solver.problem.update_forms(dt=dt)
             solver.assemble_A()
         
+    def switch_dt(self, dt):
+        """like change_dt, but keeps the matrices of recently used time steps
+        and switches back to them without reassembly"""
+        solver = self.solver
+        problem = solver.problem
+        dt0 = problem.params.get("dt")
+        if dt0 == dt:
+            return
+        if not hasattr(self, "_dtcache"):
+            self._dtcache = OrderedDict()
+        cache = self._dtcache
+        cache[dt0] = (problem.a, problem.L, solver.S, solver.b)
+        if dt in cache:
+            problem.a, problem.L, solver.S, solver.b = cache.pop(dt)
+            problem.params["dt"] = dt
+        else:
+            problem.update_forms(dt=dt)
+            solver.assemble_A()
+        while len(cache) > self.dtcache - 1:
+            cache.popitem(last=False)
+        self.dt = dt
+
+    def adaptive_timestep(self, tol, dtmax=None, dtmin=None, extrapolate=True):
+        """error-controlled backward Euler step with step doubling.
+
+        one step with dt is compared to two steps with dt/2, the difference
+        estimates the local error (in the max norm) of the latter. the step
+        is repeated with dt/2 while the error is larger than tol; if it is
+        below tol/4, the next step uses 2*dt. dt only changes by factors of 2,
+        so few distinct matrices have to be factorized (see switch_dt).
+        with extrapolate=True, the accepted solution is the Richardson
+        extrapolation 2*u(dt/2) - u(dt). returns the accepted time step;
+        afterwards, self.dt, problem.params["dt"] and the matrix all belong
+        to the step proposed for the next call."""
+        u = self.solution.vector()
+        u0 = u.copy()
+        dt = self.dt
+        while True:
+            self.switch_dt(dt)
+            self.solver.solve()
+            u1 = u.copy()
+            u.zero()
+            u.axpy(1., u0)
+            self.switch_dt(dt/2.)
+            self.solver.solve()
+            self.solver.solve()
+            e = u.copy()
+            e.axpy(-1., u1)
+            err = e.norm("linf")
+            if err <= tol or (dtmin is not None and dt/2. < dtmin):
+                break
+            u.zero()
+            u.axpy(1., u0)
+            dt = dt/2.
+
+        if extrapolate:
+            u.axpy(1., e)
+        if err < tol/4. and (dtmax is None or 2.*dt <= dtmax):
+            self.switch_dt(2.*dt)
+        else:
+            self.switch_dt(dt)
+        return dt
+
     def timestep(self, **params):
-        PDESystem.solve(self, verbose=False, **params)
+        if params:
+            PDESystem.solve(self, verbose=False, **params)
+            return
+        # fast path, skips the generic solve loop
+        for solver in self.solvers.values():
+            solver.solve()
         
     def solve(self, t=0, verbose=True, visualize=False, record_functionals=True, **params):
         if not hasattr(self, "timerange"):
@@ -78,6 +157,27 @@ class TransientLinearPDE(PDESystem):
         if visualize:
             self.finish_plots()
             
+    def solve_adaptive(self, t, tol=1e-3, verbose=True, visualize=False,
+                       record_functionals=True, **params):
+        "evolve system up to (at least) time t with adaptive_timestep"
+        t_ = self.time[-1] if self.time else 0.
+        if verbose:
+            print "\n"
+        while t_ < t:
+            dt = self.adaptive_timestep(tol, **params)
+            t_ += dt
+            self.time.append(t_)
+            if verbose:
+                print "\x1b[A","\r",
+                print "t = %s [s], dt = %s [s]" %(t_, dt)
+            if record_functionals:
+                self.record_functionals()
+            if visualize:
+                self.visualize()
+
+        if visualize:
+            self.finish_plots()
+
     def timesteps(self, t=0, **params):
         if not hasattr(self, "timerange"):
             self.timerange = timerange(t, self.dt)
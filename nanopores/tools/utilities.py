@@ -14,7 +14,7 @@ __all__ = ["import_vars", "get_mesh", "u_to_matlab", "plot_on_sub", "save_dict",
            "crange", "plot1D", "showplots", "saveplots", "loadplots", "add_params",
            "plot_cross", "plot_cross_vector", "load_dict", "save_stuff", "load_stuff",
            "save_functions", "load_functions", "load_vector_functions", "load_mesh",
-           "convert3D", "convert2D", "RectangleMesh", "savefigs", "Params",
+           "convert3D", "convert2D", "RectangleMesh", "evaluate2D", "savefigs", "Params",
            "user_params", "user_param", "dict_union", "union", "plot_sliced_mesh",
            "smooth", "collect", "collect_dict", "assertdir", "any_params"]
 
@@ -388,14 +388,8 @@ def any_params(**params):
     params.update(args)
     return Params(params)
 
-class Params(dict):
-    "for writing params.Qmol instead of params['Qmol']"
-    def __getattr__(self, key):
-        return self[key]
-    def __or__(self, other):
-        new = Params(self)
-        new.update(other)
-        return new
+# defined in fields, which can be used without dolfin
+from nanopores.tools.fields import Params
 
 def union(*seq):
     return reduce(lambda x, y: x | y, seq)
@@ -410,64 +404,82 @@ def dict_union(*seq):
 def RectangleMesh(a, b, nx, ny):
     return dolfin.RectangleMesh(dolfin.Point(array(a)), dolfin.Point(array(b)), nx, ny)
 
+_tri_cache = {}
+
+def _triangulation(mesh):
+    "matplotlib triangulation of 2D mesh, kept for the last mesh used"
+    key = (mesh.id(), mesh.num_vertices())
+    if not key in _tri_cache:
+        import matplotlib.tri as mtri
+        _tri_cache.clear()
+        co = mesh.coordinates()
+        _tri_cache[key] = mtri.Triangulation(co[:, 0], co[:, 1], mesh.cells())
+    return _tri_cache[key]
+
+def evaluate2D(F, X, Y):
+    """evaluate function F on 2D mesh at all points (X, Y) at once.
+    F is interpolated linearly from its vertex values, points outside the
+    mesh are masked. returns masked array of shape X.shape for scalar F
+    and (value dimension,) + X.shape for vector-valued F.
+    this is exact only for CG1 functions: P2 or DG input (e.g. a Stokes
+    velocity) is reduced to vertex-linear data, use F(x) where that matters."""
+    import matplotlib.tri as mtri
+    mesh = F.function_space().mesh()
+    # point location is done once per mesh and cached in tri
+    tri = _triangulation(mesh)
+    values = F.compute_vertex_values(mesh).reshape(-1, mesh.num_vertices())
+    U = np.ma.array([mtri.LinearTriInterpolator(tri, v)(X, Y) for v in values])
+    return U[0] if F.value_rank() == 0 else U
+
+def _axisym_values(F, r, z):
+    """radial and axial component of axisymmetric 2D vector function F at
+    points (r, z), shape (N, 2). uses evaluate2D, points missed by its
+    point location (e.g. on curved boundaries) are evaluated one by one."""
+    U = evaluate2D(F, r, z)
+    values = np.ma.filled(U, np.nan).T
+    missed = np.isnan(values).any(axis=1)
+    for k in np.nonzero(missed)[0]:
+        values[k] = F([r[k], z[k]])
+    return values
+
+def _vertex_function(V, values):
+    "CG1 function with given vertex values of shape (vertices, value dim)"
+    from nanopores.tools.geometry import _set_dofs
+    f = dolfin.Function(V)
+    # local vertex -> local dof, only owned dofs are written
+    _set_dofs(f, dolfin.vertex_to_dof_map(V), values.reshape(-1))
+    return f
+
 def convert3D(mesh3D, *forces):
-    "convert force from axisymmetric 2D simulation to 3D vector function"
-    def rad(x, y):
-        return dolfin.sqrt(x**2 + y**2)
-
-    class Convert3DExpression(dolfin.Expression):
-        def __init__(self, F, **kwargs):
-            self.F = F
-        def value_shape(self):
-            return (3,)
-        def eval(self, value, x):
-            r = rad(x[0], x[1])
-            F = self.F([r, x[2]])
-            if r==0.:
-                value[0] = 0.
-                value[1] = 0.
-                value[2] = F[1]
-            else:
-                value[0] = x[0]/r*F[0]
-                value[1] = x[1]/r*F[0]
-                value[2] = F[1]
-
-    #U = dolfin.FunctionSpace(mesh3D, "CG", 1)
-    #V = dolfin.MixedFunctionSpace([U, U, U])
+    """convert force from axisymmetric 2D simulation to 3D vector function.
+    the forces are sampled at their vertex values (see evaluate2D)."""
     V = dolfin.VectorFunctionSpace(mesh3D, "CG", 1)
+    x = mesh3D.coordinates()
+    r = np.sqrt(x[:, 0]**2 + x[:, 1]**2)
+    # x/r, y/r, which is 0 on the axis
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cos = np.where(r > 0., x[:, 0]/r, 0.)
+        sin = np.where(r > 0., x[:, 1]/r, 0.)
+
     def to3D(F):
-        F2 = dolfin.project(Convert3DExpression(F, degree=1), V)
-        #F2 = dolfin.Function(V)
-        #F2.interpolate(Convert3DExpression(F))
-        return F2
+        F2 = _axisym_values(F, r, x[:, 2])
+        values = np.column_stack([cos*F2[:, 0], sin*F2[:, 0], F2[:, 1]])
+        return _vertex_function(V, values)
     return tuple(map(to3D, forces))
 
 def convert2D(mesh2D, *forces):
-    "convert force from axisymmetric 2D simulation to 2D vector function"
+    """convert force from axisymmetric 2D simulation to 2D vector function.
+    the forces are sampled at their vertex values (see evaluate2D)."""
     dolfin.parameters['allow_extrapolation'] = False
-    class Convert2DExpression(dolfin.Expression):
-        def __init__(self, F, **kwargs):
-            self.F = F
-        def value_shape(self):
-            return (2,)
-        def eval(self, value, x):
-            r = abs(x[0])
-            F = self.F([r, x[1]])
-            if r==0.:
-                value[0] = 0.
-                value[1] = F[1]
-            else:
-                value[0] = x[0]/r*F[0]
-                value[1] = F[1]
-
-    #U = dolfin.FunctionSpace(mesh2D, "CG", 1)
-    #V = dolfin.MixedFunctionSpace([U, U])
     V = dolfin.VectorFunctionSpace(mesh2D, "CG", 1)
+    x = mesh2D.coordinates()
+    r = np.abs(x[:, 0])
+    sign = np.sign(x[:, 0]) # 0 on the axis
+
     def to2D(F):
-        F2 = dolfin.project(Convert2DExpression(F, degree=1), V)
-        #F2 = dolfin.Function(V)
-        #F2.interpolate(Convert3DExpression(F))
-        return F2
+        F2 = _axisym_values(F, r, x[:, 1])
+        values = np.column_stack([sign*F2[:, 0], F2[:, 1]])
+        return _vertex_function(V, values)
     return tuple(map(to2D, forces))
 
 class Collector(list):
@@ -482,7 +494,86 @@ def collect(iterator):
 class CollectorDict(dict):
     new = None
 
-def collect_dict(iterator):
+def collect_dict(iterator, f=None, nproc=1, name=None, params=None):
+    """collect dicts computed for every x in iterator into a dict of lists.
+
+    without f, this is a generator used as
+        for x, result in collect_dict(X):
+            result.new = {...}
+    with f(x) --> dict given, the points are independent and are computed with
+    nproc processes (or all MPI processes); the result is the same dict of
+    lists, in the order of iterator. if name is given, every point is saved
+    with fields (under name and params) as soon as it is done, and points
+    already saved there are not computed again. points may be numbers,
+    strings or (nested) tuples, lists or arrays of those."""
+    if f is None:
+        return _collect_dict(iterator)
+    from nanopores.scripts.simulation2D import parallel_map
+    from nanopores.tools import fields
+    X = list(iterator)
+    if name is None:
+        results = parallel_map(f, X, nproc)
+        if results is None: # MPI process other than 0
+            return None
+        result = CollectorDict({})
+        for i, new in enumerate(results):
+            for key in new:
+                if i==0:
+                    result[key] = [new[key]]
+                else:
+                    result[key].append(new[key])
+        return result
+
+    if params is None:
+        params = {}
+    # points are compared in the form they take after saving to json
+    # (tuples and arrays become lists)
+    keys = [_json_key(x) for x in X]
+    # merge files saved by earlier, possibly interrupted runs
+    _update_fields()
+    done = []
+    if fields.exists(name, **params):
+        done = fields.get_field(name, "x", **params)
+    todo = [x for x, key in zip(X, keys) if not key in done]
+    if len(todo) < len(X):
+        print "Found %d/%d points of '%s', computing the rest." % (
+            len(X) - len(todo), len(X), name)
+
+    def run(x):
+        _save_point(name, params, x, f(x))
+
+    if parallel_map(run, todo, nproc) is None:
+        return None # MPI process other than 0
+    # with MPI, all other processes are done saving when parallel_map returns
+    fields.update()
+    data = fields.get_fields(name, **params)
+    I = [data["x"].index(key) for key in keys]
+    return CollectorDict({key: [data[key][i] for i in I]
+                          for key in data if key != "x"})
+
+def _save_point(name, params, x, new):
+    # module level, so that closures sent to worker processes do not
+    # capture (and pickle) the fields module
+    from nanopores.tools import fields
+    fields.save_fields(name, params, x=[_json_key(x)],
+                       **{key: [new[key]] for key in new})
+
+def _update_fields():
+    "fields.update() is not parallel-safe: with MPI, only process 0 merges"
+    from mpi4py import MPI
+    from nanopores.tools import fields
+    comm = MPI.COMM_WORLD
+    if comm.Get_rank() == 0:
+        fields.update()
+    comm.barrier()
+
+def _json_key(x):
+    "x as it is read back from json"
+    if isinstance(x, np.ndarray) or isinstance(x, np.generic):
+        x = x.tolist()
+    return json.loads(json.dumps(x))
+
+def _collect_dict(iterator):
     result = CollectorDict({})
     for i, obj in enumerate(iterator):
         yield obj, result
@@ -2,15 +2,26 @@ import numpy, dolfin, nanopores
 from dolfin import *
 from nanopores.geometries.finfet import finfet
 from nanopores import showplots, saveplots, add_params
+from nanopores.tools import fields
+from nanopores.scripts.simulation2D import iterate_in_parallel
 from collocation import dopants
 
 add_params(
 Ndop = 4,
 h = 1.,
 maxorder = 2,
+nproc = 1,
 )
+NAME = "finfet_mlsc_sample"
 
-def solve(geo, dops):
+# every sample is a full dolfin solve on its own mesh, so samples are spread
+# over a process pool (nproc); under mpirun, all processes would share
+# (and distribute) one mesh and fields.update() would run concurrently
+if dolfin.MPI.size(dolfin.mpi_comm_world()) > 1:
+    raise SystemExit("MLSC.py runs samples with a process pool, "
+                     "use nproc=... instead of mpirun.")
+
+def solve(geo, dops, plot=True):
     tic()
     t = dolfin.Timer("phys")
     phys = nanopores.Physics("finfet", geo,
@@ -18,7 +29,8 @@ def solve(geo, dops):
         vD=None, vG=None, vS=None)
     phys.add_dopants
     t.stop()
-    dolfin.plot(geo.submesh("source"), key="dop", title="dopants in source")
+    if plot:
+        dolfin.plot(geo.submesh("source"), key="dop", title="dopants in source")
     
     t = dolfin.Timer("init")
     pde = nanopores.NonstandardPB(geo, phys)
@@ -32,19 +44,48 @@ def solve(geo, dops):
     print "Loop time: %s s" %(toc(),)
     return u
     
-def interpolate(h, order):
+_meshed = dict(h=None)
+
+def geometry(h):
+    "generate the mesh once per h, later orders read it back from the meshdir"
+    if _meshed["h"] == h:
+        return finfet.recreate_geometry()
     print "\nMeshing."
-    geo = finfet.create_geometry(lc=h)
+    _meshed["h"] = h
+    return finfet.create_geometry(lc=h)
+
+def interpolate(h, order):
+    geo = geometry(h)
     print "Number of elements:", geo.mesh.num_cells()
     print "Number of vertices:", geo.mesh.num_vertices()
     dopants_, weights = dopants(Ndop, order)
     Nsamples = len(dopants_)
+    params = dict(h=h, order=order, Ndop=Ndop)
+
+    # samples already in the fields database are skipped, so an interrupted
+    # sweep can simply be restarted
+    fields.update()
+    I = [i for i in range(Nsamples) if not fields.exists(NAME, i=i, **params)]
+    if len(I) < Nsamples:
+        print "Existing samples found, %d/%d remaining." %(len(I), Nsamples)
+
+    def run(i=None):
+        print "\nSample %d of %d:\nDopants:\n" %(i+1, Nsamples), dopants_[i], "\n"
+        # the mesh is only read back from the meshdir, not regenerated
+        geo = finfet.recreate_geometry()
+        u = solve(geo, dopants_[i], plot=(nproc == 1))
+        fields.save_functions(NAME, dict(params, i=i), u=u)
+        return dict(i=i)
+
+    if len(I) > 0:
+        iterate_in_parallel(run, nproc, i=I)
+        fields.update()
+
+    # samples live on identical copies of the same mesh, so dof vectors match
     V = FunctionSpace(geo.mesh, "CG", 1)
     Iluh = Function(V)
-    for i, (dops, weight) in enumerate(zip(dopants_, weights)):
-        print "\nSample %d of %d:\nDopants:\n" %(i+1, Nsamples), dops, "\n"
-        geo = finfet.recreate_geometry()
-        u = solve(geo, dops)
+    for i, weight in enumerate(weights):
+        u, = fields.get_functions(NAME, "u", i=i, **params)
         Iluh.vector()[:] += weight * u.vector()[:]
     return Iluh, Nsamples
     
@@ -3,7 +3,8 @@
 import numpy as np
 import math
 from itertools import product
-import matplotlib.delaunay as dln
+from scipy.interpolate import LinearNDInterpolator, NearestNDInterpolator
+from scipy.spatial import Delaunay
 import dolfin
 import nanopores
 from nanopores.models import Howorka
@@ -137,39 +138,45 @@ def uniform_grid(xi, yi, h):
 
 def data_to_S1(x, y, mesh, **values):
     "2D data clouds of vector valued functions => dolfin S1 functions"
-    trid = dln.Triangulation(x, y)
+    points = np.column_stack([x, y])
+    tri = Delaunay(points)
     #mesh = nanopores.RectangleMesh([0, -Ry], [Rx, Ry], Nx, Ny)
-    
+
     functions = []
-    for F in values.values():    
-        Fi = [None]*2
-        for i in (0,1):
-            intp = trid.nn_interpolator(F[:,i])
-            intp2 = lambda x: intp([x[0]], [x[1]])
-            Fi[i] = lambda_to_S1(intp2, mesh)
-    
-        V = dolfin.VectorFunctionSpace(mesh, "CG", 1)
-        FF = dolfin.Function(V)
-        dolfin.assign(FF, [Fi[0], Fi[1]])
-        functions.append(FF)
-    
+    for F in values.values():
+        # piecewise linear on the data triangulation, nearest data point
+        # outside of its convex hull
+        linear = LinearNDInterpolator(tri, F)
+        nearest = NearestNDInterpolator(points, F)
+        def intp(X):
+            FX = linear(X)
+            outside = np.isnan(FX).any(axis=1)
+            FX[outside] = nearest(X[outside])
+            return FX
+        functions.append(lambda_to_S1(intp, mesh, dim=2))
+
     if len(functions) == 1:
         return functions[0]
     else:
         return tuple(functions)
-    
+
 def lambda_to_S1(f, mesh, dim=1):
-    V = dolfin.FunctionSpace(mesh, "CG", 1)
+    """S1 function from f, which maps an array of points of shape (N, gdim) to
+    values of shape (N,) or (N, dim), evaluated at all vertices at once"""
     if dim>1:
-        V = dolfin.MixedFunctionSpace([V]*dim)
+        V = dolfin.VectorFunctionSpace(mesh, "CG", 1, dim=dim)
+    else:
+        V = dolfin.FunctionSpace(mesh, "CG", 1)
     f1 = dolfin.Function(V)
-    value_shape = () if dim==1 else (dim,)
-    class expr(dolfin.Expression):
-        def eval(self, value, x):
-            value[:] = f(x)
-        def value_shape(self):
-            return value_shape
-    f1.interpolate(expr())
+    values = np.asarray(f(mesh.coordinates()), dtype=float)
+    # vertex_to_dof_map gives process-local dofs, ghosts come after the
+    # locally owned ones and are set by their owner
+    d = dolfin.vertex_to_dof_map(V)
+    owned = d < f1.vector().local_size()
+    x = f1.vector().array()
+    x[d[owned]] = values.reshape(-1)[owned]
+    f1.vector().set_local(x)
+    f1.vector().apply("insert")
     return f1
     
 if __name__ == "__main__":
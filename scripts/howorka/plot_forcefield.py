@@ -26,8 +26,6 @@ def porestreamlines(polygon=None, rx=10., ry=10., Nx=100, Ny=100,
     Ny += 1
     Nx += 1
     Y, X = np.mgrid[-ry:ry:Ny*1j, -rx:rx:Nx*1j]
-    U = np.zeros((Ny,Nx))
-    V = np.zeros((Ny,Nx))
     formt = matplotlib.ticker.FuncFormatter(fmt)
     ticks = [0] + [10**n for n in range(-16, -9)]
 
@@ -40,12 +38,8 @@ def porestreamlines(polygon=None, rx=10., ry=10., Nx=100, Ny=100,
         Fstr = fields.keys()[i]
         fig, ax = plt.subplots(figsize=(5, 4.5), num=Fstr)
 
-        # fill array with function values
-        for y in range(Ny):
-            for x in range(Nx):
-                f = F(X[y][x], Y[y][x])
-                U[y][x] = f[0]
-                V[y][x] = f[1]
+        # fill array with function values, masked outside the mesh
+        U, V = nanopores.evaluate2D(F, X, Y)
 
         # streamplot with logarithmic scale
         strength = np.sqrt(U*U+V*V)
@@ -29,6 +29,7 @@ def diffusivity(setup):
 
     if geo.mesh.num_cells() < setup.solverp.Nmax:
         pugh.prerefine(setup, True)
+        geo, phys = setup.geo, setup.phys
 
     if dim==3:
         pnps.SimpleStokesProblem.method["kparams"]["maximum_iterations"] = 5000
@@ -77,6 +78,7 @@ def diffusivity_tensor(setup):
 
     if geo.mesh.num_cells() < setup.solverp.Nmax:
         pugh.prerefine(setup, True)
+        geo, phys = setup.geo, setup.phys
 
     iterative = False
     if dim==3 and geo.mesh.num_cells()>2e5:
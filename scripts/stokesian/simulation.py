@@ -10,7 +10,10 @@ framework: given list of particle centers xi and radii ri, for each timestep, ca
 
 rotational velocities can be ignored in this framework because they do not
 change the particle position."""
+import warnings
 import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
 from nanopores import kT, eta, eperm, qq, rpermw, HOME
 from matplotlib import pyplot as plt
 #from matplotlib import patches
@@ -42,6 +45,24 @@ class Particle(object):
 #        if self.circle is not None:
 #            self.circle.center = self.x[::2]
 
+class ParticleState(object):
+    """structure of arrays for a list of particles: positions x (n x 3),
+    radii a and charges q as numpy arrays, in the units of Particle"""
+
+    def __init__(self, P):
+        self.x = np.array([p.x.flatten() for p in P], dtype=float).reshape(-1, 3)
+        self.a = np.array([p.a for p in P], dtype=float)
+        self.q = np.array([float(p.charge) for p in P])
+        self.colors = [p.color for p in P]
+
+    def __len__(self):
+        return len(self.a)
+
+    def update(self, P):
+        # write positions back to particle objects
+        for p, x in zip(P, self.x):
+            p.x = x.reshape(-1, 1)
+
 class Plane(object):
 
     def __init__(self, p, n): # outer normal vextor and one point on plane
@@ -51,16 +72,16 @@ class Plane(object):
     def reflect(self, P):
         # reflect all points in P downwards that lie above plane
         # ("above" is direction of normal vector)
-        x = np.array([p.x.flatten() for p in P])
+        state = ParticleState(P)
+        self.reflect_array(state.x)
+        state.update(P)
+
+    def reflect_array(self, x):
+        # same as reflect, in place for array of positions (n x 3)
         # n * (x - p) > 0
         excess = np.dot(x - self.p, self.n.T)
         above = (excess > 0).flatten()
-        dx = np.zeros_like(x)
-        dx[above, :] = (-2.*excess*self.n)[above, :]
-
-        for i, p in enumerate(P):
-            if above[i]:
-                p.move(dx[i, :])
+        x[above, :] -= (2.*excess*self.n)[above, :]
 
 class Box(object):
     # reflect to be inside box
@@ -77,6 +98,10 @@ class Box(object):
         for plane in self.planes:
             plane.reflect(P)
 
+    def reflect_array(self, x):
+        for plane in self.planes:
+            plane.reflect_array(x)
+
 
 def msqrt(M): # matrix square root
     #U, S, V = np.linalg.svd(M)
@@ -132,29 +157,22 @@ def mobility_vectorized(P):
             M[i::n, j::n] = mobility_pp(p, q)
     return M
 
-def mobility(P):
-    # nice: M is of the form Mijkl = Aij * Ikl + Bij * Rijkl
-    # where Ikl, Rijkl are easily formed
-    # obtain vector representations of positions, radii
-    n = len(P)
-    a = 1e-9*np.array([p.a for p in P])
-    x = 1e-9*np.array([p.x.flatten() for p in P])
-    rr = np.sum((x[:, None, :] - x[None, :, :])**2, 2) + 1e-100
-    r = np.sqrt(rr)
-
+def rpy_coefficients(r, a1, a2):
+    # Rotne-Prager-Yamakawa: M_12 = A*I + B*RR for arrays of distances r
+    # and radii a1, a2 (all of the same shape)
     A = np.zeros_like(r)
     B = np.zeros_like(r)
 
-    ama = a[:, None] - a[None, :]
-    apa = a[:, None] + a[None, :]
-    asq = a[:, None]**2 + a[None, :]**2
+    ama = a1 - a2
+    apa = a1 + a2
+    asq = a1**2 + a2**2
 
     case1 = r <= np.abs(ama)
-    A[case1] = (1./(6.*np.pi*eta*np.maximum(a[:,None], a[None,:])))[case1]
+    A[case1] = (1./(6.*np.pi*eta*np.maximum(a1, a2)))[case1]
     B[case1] = 0.
 
     case2 = ~case1 & (r <= apa)
-    C = 1./(6.*np.pi*eta*a[:, None]*a[None, :])
+    C = 1./(6.*np.pi*eta*a1*a2)
     A[case2] = (C*(0.5*apa - (ama**2 + 3.*r**2)**2/(32.*r**3)))[case2]
     B[case2] = (C*(3.*(ama**2 - r**2)**2/(32.*r**3)))[case2]
 
@@ -162,6 +180,23 @@ def mobility(P):
     C = 1./(8.*np.pi*eta*r)
     A[case3] = (C*(1. + asq/(3.*r**2)))[case3]
     B[case3] = (C*(1. - asq/r**2))[case3]
+    return A, B
+
+def mobility(P):
+    state = ParticleState(P)
+    return mobility_dense(state.x, state.a)
+
+def mobility_dense(x, a):
+    # nice: M is of the form Mijkl = Aij * Ikl + Bij * Rijkl
+    # where Ikl, Rijkl are easily formed
+    # x = positions (n x 3), a = radii, in nm
+    n = len(a)
+    a = 1e-9*np.asarray(a, dtype=float)
+    x = 1e-9*np.asarray(x, dtype=float)
+    rr = np.sum((x[:, None, :] - x[None, :, :])**2, 2) + 1e-100
+    r = np.sqrt(rr)
+
+    A, B = rpy_coefficients(r, *np.broadcast_arrays(a[:, None], a[None, :]))
 
     I = np.eye(3)
     R = (x[:, None, :] - x[None, :, :])
@@ -172,6 +207,83 @@ def mobility(P):
         (B[None, :, None, :] * RR).reshape(3*n, 3*n)
     return np.matrix(M)
 
+def mobility_sparse(x, a, rcut):
+    """sparse RPY mobility where interactions between particles further
+    apart than rcut (in nm) are truncated. x = positions (n x 3), a = radii,
+    in nm like Particle.x, Particle.a. same component-major ordering as
+    mobility(). neighbor pairs are found with a KD-tree in O(n log n)."""
+    n = len(a)
+    a = 1e-9*np.asarray(a, dtype=float)
+    x = np.asarray(x, dtype=float)
+
+    # self mobility
+    rows = [np.arange(3*n)]
+    cols = [np.arange(3*n)]
+    vals = [np.tile(1./(6.*np.pi*eta*a), 3)]
+
+    # pairs within rcut, each one appears once with i < j
+    pairs = np.array(list(cKDTree(x).query_pairs(rcut)), dtype=int).reshape(-1, 2)
+    if len(pairs) > 0:
+        i, j = pairs[:, 0], pairs[:, 1]
+        R = 1e-9*(x[i] - x[j])
+        r = np.sqrt(np.sum(R**2, 1))
+        A, B = rpy_coefficients(r, a[i], a[j])
+        R0 = R / r[:, None]
+        for k in range(3):
+            for l in range(3):
+                Mkl = B*R0[:, k]*R0[:, l] + (A if k == l else 0.)
+                rows.extend([k*n + i, k*n + j])
+                cols.extend([l*n + j, l*n + i])
+                vals.extend([Mkl, Mkl])
+
+    rows, cols, vals = map(np.concatenate, (rows, cols, vals))
+    return sparse.csr_matrix((vals, (rows, cols)), shape=(3*n, 3*n))
+
+def lanczos_sqrt(M, z, maxiter=50, tol=1e-6):
+    """approximate M^(1/2) z with the Lanczos method, only needs products
+    with the symmetric positive (semi-)definite matrix M"""
+    z = np.asarray(z, dtype=float).flatten()
+    beta0 = np.linalg.norm(z)
+    if beta0 == 0.:
+        return np.zeros_like(z)
+    V = np.zeros((len(z), maxiter))
+    alpha = []
+    beta = []
+    v = z / beta0
+    y = None
+    for m in range(maxiter):
+        V[:, m] = v
+        w = M.dot(v)
+        if m > 0:
+            w -= beta[-1]*V[:, m-1]
+        alpha.append(np.dot(w, v))
+        # full reorthogonalization, cheap compared to M.dot for small m
+        w -= np.dot(V[:, :m+1], np.dot(V[:, :m+1].T, w))
+
+        # sqrt(T) e1 from eigendecomposition of the small tridiagonal T
+        T = np.diag(alpha) + np.diag(beta, 1) + np.diag(beta, -1)
+        lam, Q = np.linalg.eigh(T)
+        ynew = np.dot(Q, np.sqrt(np.maximum(lam, 0.))*Q[0, :])
+        if y is not None:
+            change = np.linalg.norm(ynew - np.append(y, 0.)) / np.linalg.norm(ynew)
+            if change < tol:
+                y = ynew
+                break
+        y = ynew
+
+        b = np.linalg.norm(w)
+        if b < 1e-14*beta0:
+            break
+        beta.append(b)
+        v = w / b
+    # T inherits the spectrum of M, so clearly negative eigenvalues mean M is
+    # not positive semi-definite (e.g. overlapping particles in RPY); they
+    # were clipped to zero above, which changes the noise covariance
+    if lam.min() < -1e-10*np.abs(lam).max():
+        warnings.warn("lanczos_sqrt: matrix is not positive semi-definite "
+                      "(eigenvalue %.3g clipped to 0)" % lam.min(),
+                      RuntimeWarning)
+    return beta0 * np.dot(V[:, :len(y)], y)
 
 def f_vectorized(P, f):
     n = len(P)
@@ -181,104 +293,124 @@ def f_vectorized(P, f):
     return F
 
 def f_electric(P):
-    n = len(P)
-    a = 1e-9*np.array([p.a for p in P])
-    apa = a[:, None] + a[None, :]
-
-
-    x = 1e-9*np.array([p.x.flatten() for p in P])
-
-    R = x[:, None, :] - x[None, :, :]
-    r = np.sqrt(np.sum(R**2, 2) + 1e-100)
-    R0 = R / (r**3)[:, :, None]
-
-    q = np.array([float(p.charge) for p in P])
+    state = ParticleState(P)
+    return electric_force(state.x, state.a, state.q)
+
+def electric_force(x, a, q, chunk=256):
+    # pairwise coulomb forces, all pairs because they are long-range.
+    # rows are summed in blocks, so memory is O(chunk*n) instead of O(n^2);
+    # the work is still O(n^2)
+    n = len(a)
+    a = 1e-9*np.asarray(a, dtype=float)
+    x = 1e-9*np.asarray(x, dtype=float)
+    q = np.asarray(q, dtype=float)
     const = qq**2 / (4.*np.pi*eperm*rpermw)
 
-    QQ = q[:, None] * q[None, :]
-    F = const * QQ[:, :, None] * R0
-    #F[np.diag_indices_from(r)] = 0.
-    tooclose = r <= apa
-    R0i = R / (np.maximum(a[:, None], a[None, :])**3)[:, :, None]
-    F[tooclose] = (const * QQ[:, :, None] * R0i)[tooclose]
+    ff = np.zeros((n, 3))
+    for k in range(0, n, chunk):
+        I = slice(k, min(k + chunk, n))
+        R = x[I, None, :] - x[None, :, :]
+        r = np.sqrt(np.sum(R**2, 2) + 1e-100)
+        # inside the particles, the field of a homogeneously charged ball
+        tooclose = r <= a[I, None] + a[None, :]
+        r3 = np.where(tooclose, np.maximum(a[I, None], a[None, :])**3, r**3)
+        QQ = q[I, None] * q[None, :]
+        ff[I] = const * np.sum((QQ / r3)[:, :, None] * R, 1)
 
-    f = np.sum(F, 1).T.reshape(3*n, 1)
-
-    return f
+    return ff.T.reshape(3*n, 1)
 
 def f_shortrange(P):
-    n = len(P)
-    a = 1e-9*np.array([p.a for p in P])
-    apa = a[:, None] + a[None, :]
-
-    x = 1e-9*np.array([p.x.flatten() for p in P])
-    R = x[:, None, :] - x[None, :, :]
-    r = np.sqrt(np.sum(R**2, 2)) + 1e-100
+    state = ParticleState(P)
+    return shortrange_force(state.x, state.a)
+
+def shortrange_force(x, a, cutoff=1.05):
+    # repulsion between particles closer than cutoff*(a1 + a2),
+    # only evaluated for neighbor pairs found with a KD-tree
+    n = len(a)
+    x = np.asarray(x, dtype=float)
+    a = np.asarray(a, dtype=float)
+    ff = np.zeros((n, 3))
+    if n < 2:
+        return ff.T.reshape(3*n, 1)
+
+    pairs = cKDTree(x).query_pairs(2.*a.max()*cutoff)
+    pairs = np.array(list(pairs), dtype=int).reshape(-1, 2)
+    i, j = pairs[:, 0], pairs[:, 1]
+    apa = 1e-9*(a[i] + a[j])
+    R = 1e-9*(x[i] - x[j])
+    r = np.sqrt(np.sum(R**2, 1)) + 1e-100
 
     #E0 = apa*1e9*10.*kT # total energy required for r = apa*1.1 --> r = 0
     #E = E0*((r/apa/1.1 - 1.)**2)
     E0 = 1e9*1e1*kT
-    cutoff = 1.05
     f = 2./cutoff*E0*np.maximum(1. - r/apa/cutoff, 0.)
 
-    R0 = R / r[:, :, None]
-    F = f[:, :, None] * R0
-    ff = np.sum(F, 1).T.reshape(3*n, 1)
-    return ff
+    F = (f / r)[:, None] * R
+    np.add.at(ff, i, F)
+    np.add.at(ff, j, -F)
+    return ff.T.reshape(3*n, 1)
 
+def brownian_force(n):
+    # same as f_vectorized(P, f_brownian) for n particles
+    rand = np.random.randn(n, 3)
+    rand[:, 1] = 0.
+    return rand.T.reshape(3*n, 1)
 
 def simulation(P, T=100., dt=1.):
     t = 0.
+    state = ParticleState(P)
     while t < T:
-        # calculate forces
-        force = f_electric(P) + f_shortrange(P)
-        brownian = f_vectorized(P, f_brownian)
-        M = mobility(P)
-        sqM = np.matrix(msqrt(M))
-
-        # determine resulting velocities
-        U = M*force + np.sqrt(2.*kT/dt*1e9)*sqM*brownian
-
-        n = len(P)
-        # move particles
-        for i, p in enumerate(P):
-            u = U[i::n]
-            p.move(dt*u)
-
+        move_state(state, dt)
+        state.update(P)
         yield t
         t += dt
 
 # static particles: no forces act on them, are not affected by
 #from time import time
 
-def move(P, dt=1., boundaries=()):
+def move(P, dt=1., boundaries=(), rcut=None):
+    state = ParticleState(P)
+    move_state(state, dt, boundaries, rcut)
+    state.update(P)
+
+def move_state(state, dt=1., boundaries=(), rcut=None):
+    # advance ParticleState by one time step, all work is done on arrays
+    x, a, q = state.x, state.a, state.q
+    n = len(a)
+
     # calculate forces
-    force = f_electric(P) + f_shortrange(P)
-    brownian = f_vectorized(P, f_brownian)
-    #t = time()
-    M = mobility(P)
-    #print "forming mobility", time() - t
-    #t = time()
-    sqM = np.matrix(msqrt(M))
-    #print "matrix square root", time() - t
-
-    # determine resulting velocities
-    Udet = M*force
-    Ubro = np.sqrt(2.*kT/dt*1e9)*sqM*brownian
+    force = electric_force(x, a, q) + shortrange_force(x, a)
+    brownian = brownian_force(n)
+
+    if rcut is None:
+        #t = time()
+        M = np.matrix(mobility_dense(x, a))
+        #print "forming mobility", time() - t
+        #t = time()
+        sqM = np.matrix(msqrt(M))
+        #print "matrix square root", time() - t
+
+        # determine resulting velocities
+        Udet = M*force
+        Ubro = np.sqrt(2.*kT/dt*1e9)*sqM*brownian
+    else:
+        # sparse mobility truncated at distance rcut and Krylov square root:
+        # O(n) for bounded particle density instead of O(n^3). the coulomb
+        # force above still takes O(n^2) work per step.
+        M = mobility_sparse(x, a, rcut)
+        Udet = M.dot(force)
+        Ubro = np.sqrt(2.*kT/dt*1e9)*lanczos_sqrt(M, brownian).reshape(-1, 1)
     #U = M*force + np.sqrt(2.*kT/dt*1e9)*sqM*brownian
-    U = Udet + Ubro
+    U = np.asarray(Udet + Ubro)
     #print "P0:", Udet[0], Ubro[0]
     #print "P1:", Udet[1], Ubro[1]
     #print
 
-    n = len(P)
     # move particles
-    for i, p in enumerate(P):
-        u = U[i::n]
-        p.move(dt*u)
+    x += dt*U.reshape(3, n).T
 
     for b in boundaries:
-        b.reflect(P)
+        b.reflect_array(x)
 
 class ParticleCollection(object):
     def __init__(self, particles=None):
@@ -302,8 +434,9 @@ def ellipse_collection(ax, P):
                transOffset=ax.transData, alpha=0.7)
     return coll
 
-def panimate(ax, dt, pcoll, patches, boundaries, **kwargs):
+def panimate(ax, dt, pcoll, patches, boundaries, rcut=None, **kwargs):
     particles = pcoll.P
+    state = ParticleState(particles)
     coll = ellipse_collection(ax, particles)
     def init():
         return ()
@@ -317,9 +450,8 @@ def panimate(ax, dt, pcoll, patches, boundaries, **kwargs):
                 ax.add_patch(patch)
             ax.add_collection(coll)
         else:
-            move(particles, dt, boundaries)
-            xy = np.array([p.x[::2].flatten() for p in particles])
-            coll.set_offsets(xy)
+            move_state(state, dt, boundaries, rcut)
+            coll.set_offsets(state.x[:, ::2])
         return tuple(patches + [coll])
 
     kwargs = dict(dict(frames=1800, interval=10, blit=True), **kwargs)